@@ -0,0 +1,208 @@
+from argparse import ArgumentParser
+from asyncio import get_event_loop, new_event_loop, set_event_loop
+from json import dump, load
+from platform import python_version
+from sys import stdout
+from timeit import Timer
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from asyncmetrics import (CountMetric, Graphite, GzipTcp, MaxMsMetric, Metric, NsMetric, PlainTcp, SumUsMetric,
+                          __version__)
+from asyncmetrics.protocols.protocol import Protocol
+
+BENCHMARKS = {}  # type: Dict[str, Callable[[], Dict[str, float]]]
+BATCH_SIZES = (1000, 10000, 100000)
+
+
+def benchmark(name: str):
+    def deco(func):
+        BENCHMARKS[name] = func
+        return func
+    return deco
+
+
+def measure(stmt: Callable, repeat: int = 5, setup: Callable = lambda: None) -> float:
+    timer = Timer(stmt, setup=setup)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run_until_complete(coro):
+    return get_event_loop().run_until_complete(coro)
+
+
+class NullProtocol(Protocol):
+    async def send(self, dataset):
+        pass
+
+
+class GraphiteSink(Graphite):
+    # noinspection PyMissingConstructor
+    def __init__(self):
+        pass
+
+    def send(self, metric, value, timestamp=None):
+        pass
+
+    def aggregate(self, metric, value, aggregation, weight=1):
+        pass
+
+
+def make_dataset(size: int) -> list:
+    names = ['bench.series{}'.format(x).encode('ascii') for x in range(1000)]
+    return [(names[x % 1000], x, 1600000000 + x // 10000) for x in range(size)]
+
+
+def reference_encode(dataset: Iterable[Tuple[str, int, int]]) -> bytes:
+    return ''.join('{} {} {}\n'.format(*tpl) for tpl in dataset).encode('ascii')
+
+
+def func():
+    pass
+
+
+async def coro():
+    pass
+
+
+@benchmark('metric.count')
+def bench_metric_count() -> Dict[str, float]:
+    sink = GraphiteSink()
+    counted = Metric('bench', graphite=sink).count(func)
+    aggregated = CountMetric('bench', graphite=sink).count(func)
+    sampled = CountMetric('bench', graphite=sink, sample_rate=.01).count(func)
+    counted_async = Metric('bench', graphite=sink).count(coro)
+
+    async def run_async():
+        await counted_async()
+
+    async def run_baseline():
+        await coro()
+
+    baseline = measure(func)
+    baseline_async = measure(lambda: run_until_complete(run_baseline()))
+    return {
+        'baseline': baseline,
+        'sync': measure(counted) - baseline,
+        'sync.aggregated': measure(aggregated) - baseline,
+        'sync.sampled': measure(sampled) - baseline,
+        'async': measure(lambda: run_until_complete(run_async())) - baseline_async,
+    }
+
+
+@benchmark('metric.time')
+def bench_metric_time() -> Dict[str, float]:
+    sink = GraphiteSink()
+    timed = NsMetric('bench', graphite=sink).time(func)
+    aggregated = SumUsMetric('bench', graphite=sink).time(func)
+    sampled = SumUsMetric('bench', graphite=sink, sample_rate=.01).time(func)
+    timed_async = NsMetric('bench', graphite=sink).time(coro)
+
+    async def run_async():
+        await timed_async()
+
+    async def run_baseline():
+        await coro()
+
+    baseline = measure(func)
+    baseline_async = measure(lambda: run_until_complete(run_baseline()))
+    return {
+        'baseline': baseline,
+        'sync': measure(timed) - baseline,
+        'sync.aggregated': measure(aggregated) - baseline,
+        'sync.sampled': measure(sampled) - baseline,
+        'async': measure(lambda: run_until_complete(run_async())) - baseline_async,
+    }
+
+
+@benchmark('metric.name')
+def bench_metric_name() -> Dict[str, float]:
+    metric = MaxMsMetric('bench')
+    metric._graphite = GraphiteSink()
+    metric._resolve()
+    return {
+        'property': measure(lambda: metric.metric),
+        'resolve': measure(metric._resolve),
+    }
+
+
+@benchmark('graphite.send')
+def bench_graphite_send() -> Dict[str, float]:
+    async def run():
+        async with Graphite(NullProtocol(), flush_interval=3600, queue_size=1 << 22) as graphite:
+            name = b'bench.graphite.send'
+            tags = {'region': 'eu', 'dc': 'ams1'}
+
+            def drain():
+                graphite._buffer.pop()
+
+            return {
+                'send': measure(lambda: graphite.send(name, 1, 1600000000), setup=drain),
+                'send.str': measure(lambda: graphite.send('bench.graphite.send', 1, 1600000000), setup=drain),
+                'send.now': measure(lambda: graphite.send(name, 1), setup=drain),
+                'send.tags': measure(lambda: graphite.send(name, 1, 1600000000, tags=tags), setup=drain),
+            }
+
+    return run_until_complete(run())
+
+
+@benchmark('protocol.encode')
+def bench_protocol_encode() -> Dict[str, float]:
+    results = {}
+
+    for protocol_class in PlainTcp, GzipTcp:
+        protocol = protocol_class()
+
+        for size in BATCH_SIZES:
+            dataset = make_dataset(size)
+            key = '{}.{}'.format(protocol_class.__name__, size)
+            results[key] = measure(lambda: protocol._encode(dataset), repeat=3) / size
+
+    for size in BATCH_SIZES:
+        dataset = [(metric.decode('ascii'), value, timestamp) for metric, value, timestamp in make_dataset(size)]
+        assert reference_encode(dataset) == PlainTcp()._encode(dataset)
+        results['reference.{}'.format(size)] = measure(lambda: reference_encode(dataset), repeat=3) / size
+
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]):
+    for name, values in sorted(results.items()):
+        for key, value in sorted(values.items()):
+            old = baseline.get(name, {}).get(key)
+
+            if old:
+                stdout.write('{:<40} {:>12.1f} ns {:>12.1f} ns {:>+8.1%}\n'.format(
+                    '{}.{}'.format(name, key), old * 1e9, value * 1e9, value / old - 1,
+                ))
+
+
+def main(output: Optional[str] = None, baseline: Optional[str] = None, only: Optional[str] = None):
+    set_event_loop(new_event_loop())
+    results = {}
+
+    for name, func in sorted(BENCHMARKS.items()):
+        if only and not name.startswith(only):
+            continue
+
+        results[name] = func()
+
+        for key, value in sorted(results[name].items()):
+            stdout.write('{:<40} {:>12.1f} ns\n'.format('{}.{}'.format(name, key), value * 1e9))
+
+    if output:
+        with open(output, 'w') as f:
+            dump({'version': __version__, 'python': python_version(), 'results': results}, f, indent=2)
+
+    if baseline:
+        with open(baseline) as f:
+            compare(results, load(f)['results'])
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Run asyncmetrics micro-benchmarks")
+    parser.add_argument('-o', '--output', help="save results to JSON file")
+    parser.add_argument('-c', '--compare', help="compare with results from JSON file")
+    parser.add_argument('-k', '--only', help="run benchmarks whose name starts with this prefix")
+    args = parser.parse_args()
+    main(args.output, args.compare, args.only)
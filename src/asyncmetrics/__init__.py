@@ -1,12 +1,16 @@
 from .graphite import *
 from .metric import *
 from .protocols import *
+from .registry import *
+from .spill import *
 
 
 __all__ = [
     *graphite.__all__,
     *metric.__all__,
     *protocols.__all__,
+    *registry.__all__,
+    *spill.__all__,
 ]
 
 __version__ = '0.4.0'
@@ -0,0 +1,183 @@
+from math import ceil
+from typing import Dict, Iterable, Sequence, Tuple
+
+__all__ = [
+    'Aggregation',
+    'AvgAggregation',
+    'CountAggregation',
+    'HistogramAggregation',
+    'MaxAggregation',
+    'MinAggregation',
+    'SumAggregation',
+]
+
+
+class Aggregation:
+    __slots__ = ('_value',)
+
+    def __init__(self, value: int, weight: int = 1):
+        self._value = value
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    @classmethod
+    def from_state(cls, state: Sequence[int]) -> 'Aggregation':
+        instance = cls.__new__(cls)
+        instance._value, = state
+        return instance
+
+    @property
+    def state(self) -> Tuple[int, ...]:
+        return self._value,
+
+    def add(self, value: int, weight: int = 1):
+        raise NotImplementedError
+
+    def merge(self, other: 'Aggregation'):
+        self.add(other._value)
+
+    def items(self) -> Iterable[Tuple[bytes, int]]:
+        return (b'', self.value),
+
+
+class MaxAggregation(Aggregation):
+    __slots__ = ()
+
+    def add(self, value: int, weight: int = 1):
+        if value > self._value:
+            self._value = value
+
+
+class MinAggregation(Aggregation):
+    __slots__ = ()
+
+    def add(self, value: int, weight: int = 1):
+        if value < self._value:
+            self._value = value
+
+
+class SumAggregation(Aggregation):
+    __slots__ = ()
+
+    # noinspection PyMissingConstructor
+    def __init__(self, value: int, weight: int = 1):
+        self._value = value * weight
+
+    def add(self, value: int, weight: int = 1):
+        self._value += value * weight
+
+
+class CountAggregation(SumAggregation):
+    __slots__ = ()
+
+
+class AvgAggregation(Aggregation):
+    __slots__ = ('_count',)
+
+    def __init__(self, value: int, weight: int = 1):
+        super().__init__(value * weight)
+        self._count = weight
+
+    @classmethod
+    def from_state(cls, state: Sequence[int]) -> 'AvgAggregation':
+        instance = cls.__new__(cls)
+        instance._value, instance._count = state
+        return instance
+
+    @property
+    def state(self) -> Tuple[int, ...]:
+        return self._value, self._count
+
+    @property
+    def value(self) -> int:
+        return int(round(self._value / self._count))
+
+    def add(self, value: int, weight: int = 1):
+        self._value += value * weight
+        self._count += weight
+
+    def merge(self, other: 'AvgAggregation'):
+        self._value += other._value
+        self._count += other._count
+
+
+class HistogramAggregation(Aggregation):
+    __slots__ = ('_count', '_counts')
+    precision = 7
+    percentiles = (50, 90, 99)
+
+    def __init__(self, value: int, weight: int = 1):
+        value = max(value, 0)
+        super().__init__(value)
+        self._count = weight
+        self._counts = {self._index(value): weight}  # type: Dict[int, int]
+
+    @classmethod
+    def from_state(cls, state: Sequence[int]) -> 'HistogramAggregation':
+        instance = cls.__new__(cls)
+        instance._value, instance._count = state[:2]
+        instance._counts = dict(zip(state[2::2], state[3::2]))
+        return instance
+
+    @property
+    def state(self) -> Tuple[int, ...]:
+        state = [self._value, self._count]
+
+        for item in self._counts.items():
+            state.extend(item)
+
+        return tuple(state)
+
+    def add(self, value: int, weight: int = 1):
+        value = max(value, 0)
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + weight
+        self._count += weight
+
+        if value > self._value:
+            self._value = value
+
+    def merge(self, other: 'HistogramAggregation'):
+        counts = self._counts
+
+        for index, count in other._counts.items():
+            counts[index] = counts.get(index, 0) + count
+
+        self._count += other._count
+
+        if other._value > self._value:
+            self._value = other._value
+
+    def items(self) -> Iterable[Tuple[bytes, int]]:
+        ranks = [(max(1, ceil(self._count * x / 100)), x) for x in sorted(self.percentiles)]
+        items = []
+        seen = 0
+
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+
+            while ranks and seen >= ranks[0][0]:
+                _, percentile = ranks.pop(0)
+                items.append((b'.p%d' % percentile, min(self._upper(index), self._value)))
+
+        items.append((b'.max', self._value))
+        items.append((b'.count', self._count))
+        return items
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.precision
+
+        if shift <= 0:
+            return value
+
+        return (shift << (self.precision - 1)) + (value >> shift)
+
+    def _upper(self, index: int) -> int:
+        shift = (index >> (self.precision - 1)) - 1
+
+        if shift <= 0:
+            return index
+
+        return ((index - (shift << (self.precision - 1)) + 1) << shift) - 1
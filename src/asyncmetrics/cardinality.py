@@ -0,0 +1,50 @@
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+__all__ = [
+    'CardinalityGuard',
+]
+
+
+class CardinalityGuard:
+    def __init__(self, max_series: Optional[int] = None, *, prefixes: Optional[Dict[str, int]] = None,
+                 overflow: Optional[str] = None):
+        self._max_series = max_series
+        self._prefixes = [
+            (prefix.encode('ascii'), limit)
+            for prefix, limit in sorted((prefixes or {}).items(), key=lambda x: len(x[0]), reverse=True)
+        ]  # type: List[Tuple[bytes, int]]
+        self._counts = [0] * len(self._prefixes)
+        self._overflow = overflow
+        self._overflow_bytes = overflow.encode('ascii') if overflow else None
+        self._seen = set()  # type: Set[bytes]
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def admit(self, name: Union[str, bytes]) -> Optional[Union[str, bytes]]:
+        key = name if isinstance(name, bytes) else name.encode('utf-8')
+
+        if key in self._seen:
+            return name
+
+        if self._max_series is not None and len(self._seen) >= self._max_series:
+            return self._reject(name)
+
+        for index, (prefix, limit) in enumerate(self._prefixes):
+            if key.startswith(prefix):
+                if self._counts[index] >= limit:
+                    return self._reject(name)
+
+                self._counts[index] += 1
+                break
+        else:
+            if self._max_series is None:
+                return name
+
+        self._seen.add(key)
+        return name
+
+    def _reject(self, name: Union[str, bytes]) -> Optional[Union[str, bytes]]:
+        self.rejected += 1
+        return self._overflow_bytes if isinstance(name, bytes) else self._overflow
@@ -0,0 +1,52 @@
+from random import uniform
+from time import monotonic
+
+__all__ = [
+    'CircuitBreaker',
+]
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, *, min_delay: float = .5, max_delay: float = 60., jitter: float = .5):
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._jitter = jitter
+        self._state = self.CLOSED
+        self._failures = 0
+        self._delay = 0.
+        self._opened_at = 0.
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    @property
+    def delay(self) -> float:
+        return self._delay
+
+    @property
+    def retry_in(self) -> float:
+        return max(0., self._opened_at + self._delay - monotonic())
+
+    def fail(self):
+        self._failures += 1
+        delay = min(self._max_delay, self._min_delay * 2 ** min(self._failures - 1, 64))
+        self._delay = delay * uniform(1 - self._jitter, 1)
+        self._opened_at = monotonic()
+        self._state = self.OPEN
+
+    def half_open(self):
+        self._state = self.HALF_OPEN
+
+    def succeed(self):
+        self._failures = 0
+        self._delay = 0.
+        self._state = self.CLOSED
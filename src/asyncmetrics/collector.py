@@ -0,0 +1,123 @@
+from argparse import ArgumentParser
+from asyncio import IncompleteReadError, StreamReader, StreamWriter, new_event_loop, set_event_loop, start_unix_server
+from logging import INFO, basicConfig, getLogger
+from os import path, remove
+from struct import Struct
+from typing import Optional, Set
+
+from .aggregation import Aggregation
+from .graphite import Graphite
+from .protocols import GzipTcp, PickleTcp, PlainTcp
+from .protocols.partial import Partial
+
+__all__ = [
+    'Collector',
+]
+
+logger = getLogger(__package__)
+
+_frame = Struct('<L')
+
+PROTOCOLS = {
+    'gzip': GzipTcp,
+    'pickle': PickleTcp,
+    'plain': PlainTcp,
+}
+
+
+class Collector:
+    def __init__(self, graphite: Graphite, path: str, *, max_frame_size: int = 16777216):
+        self._graphite = graphite
+        self._path = path
+        self._max_frame_size = max_frame_size
+        self._server = None
+        self._writers = set()  # type: Set[StreamWriter]
+        self._received = 0
+
+    @property
+    def received(self) -> int:
+        return self._received
+
+    async def start(self):
+        if path.exists(self._path):
+            remove(self._path)
+
+        self._server = await start_unix_server(self._handle, self._path)
+        logger.info("Collecting metrics at %s", self._path)
+
+    async def close(self):
+        if self._server is None:
+            return
+
+        self._server.close()
+
+        for writer in list(self._writers):
+            writer.close()
+
+        await self._server.wait_closed()
+        self._server = None
+
+        if path.exists(self._path):
+            remove(self._path)
+
+    async def _handle(self, reader: StreamReader, writer: StreamWriter):
+        self._writers.add(writer)
+
+        try:
+            while True:
+                length, = _frame.unpack(await reader.readexactly(_frame.size))
+
+                if length > self._max_frame_size:
+                    raise ValueError("Frame of {} bytes is over the limit".format(length))
+
+                self._collect(await reader.readexactly(length))
+        except IncompleteReadError:
+            pass
+        except Exception as exc:
+            logger.error("Dropping collector connection: %s", exc)
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _collect(self, payload: bytes):
+        graphite = self._graphite
+
+        for metric, point in Partial.decode(payload):
+            if isinstance(point, Aggregation):
+                graphite.merge(metric, point)
+            else:
+                graphite.send(metric, *point)
+
+            self._received += 1
+
+
+def main(socket: str, host: str, port: Optional[int], flush_interval: float, stats_prefix: Optional[str] = None,
+         protocol: str = 'plain'):
+    basicConfig(level=INFO)
+    loop = new_event_loop()
+    set_event_loop(loop)
+    protocol_class = PROTOCOLS[protocol]
+    graphite = Graphite(protocol_class(host, port) if port else protocol_class(host), flush_interval=flush_interval,
+                        stats_prefix=stats_prefix)
+    collector = Collector(graphite, socket)
+    loop.run_until_complete(collector.start())
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(collector.close())
+        loop.run_until_complete(graphite.close())
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Merge metrics from local workers and forward them to carbon")
+    parser.add_argument('socket', help="unix socket path to listen on")
+    parser.add_argument('--host', default='127.0.0.1', help="carbon host")
+    parser.add_argument('--port', type=int, help="carbon port, protocol default if omitted")
+    parser.add_argument('--protocol', choices=sorted(PROTOCOLS), default='plain', help="carbon protocol")
+    parser.add_argument('--flush-interval', type=float, default=1., help="seconds between batches")
+    parser.add_argument('--stats-prefix', help="prefix for the collector's own stats")
+    args = parser.parse_args()
+    main(args.socket, args.host, args.port, args.flush_interval, args.stats_prefix, args.protocol)
@@ -1,97 +1,592 @@
-from asyncio import CancelledError, Queue, ensure_future, shield, sleep
+from asyncio import AbstractEventLoop, CancelledError, Event, Future, ensure_future, shield, sleep
+from itertools import chain
 from logging import getLogger
-from time import time
-from typing import Optional
+from threading import Lock, get_ident, local
+from time import monotonic, time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type, Union
 
+from .aggregation import Aggregation
+from .cardinality import CardinalityGuard
+from .circuitbreaker import CircuitBreaker
+from .localbuffer import LocalBuffer
 from .protocols import PlainTcp, ProtocolError
 from .protocols.protocol import Protocol
+from .registry import Registry
+from .ringbuffer import RingBuffer
+from .spill import SpillStore
+from .tags import encode_tags, insert_suffix
+
+try:
+    from asyncio import get_running_loop
+except ImportError:
+    from asyncio import get_event_loop
+
+    def get_running_loop() -> AbstractEventLoop:
+        loop = get_event_loop()
+
+        if not loop.is_running():
+            raise RuntimeError("no running event loop")
+
+        return loop
 
 __all__ = [
     'Graphite',
+    'NullGraphite',
 ]
 
 logger = getLogger(__package__)
 
 
 class Graphite:
-    def __init__(self, protocol: Protocol = PlainTcp(), *,
-                 queue_size: int = 1000000, flush_interval: float = 1., fail_wait: float = 60.):
+    def __init__(self, protocol: Optional[Protocol] = None, *,
+                 queue_size: int = 1000000, flush_interval: float = 1., fail_wait: float = 60.,
+                 fail_wait_min: float = .5, probe_size: int = 100, max_batch_points: int = 10000,
+                 spill: Optional[SpillStore] = None, spill_rate: int = 10000, stats_prefix: Optional[str] = None,
+                 thread_safe: bool = False, max_series: Optional[int] = None,
+                 max_series_per_prefix: Optional[Dict[str, int]] = None, overflow_series: Optional[str] = None,
+                 registry: Optional[Registry] = None):
+        protocol = protocol or PlainTcp()
         self._protocol = protocol
-        self._queue = Queue()
-        self._sender_task = ensure_future(self._sender())
-        self._running = True
         self._queue_size = queue_size
+        self._buffer = RingBuffer(queue_size, keep_evicted=spill is not None)
+        self._aggregations = {}  # type: Dict[Union[str, bytes], Aggregation]
+        self._pending = None  # type: Optional[Event]
+        self._thread_safe = thread_safe
+        self._registry = registry
+        self._guard = None  # type: Optional[CardinalityGuard]
+
+        if max_series is not None or max_series_per_prefix:
+            self._guard = CardinalityGuard(max_series, prefixes=max_series_per_prefix, overflow=overflow_series)
+
+        self._loop = None  # type: Optional[AbstractEventLoop]
+        self._thread_id = None  # type: Optional[int]
+        self._local = local()
+        self._local_buffers = []  # type: List[LocalBuffer]
+        self._local_lock = Lock()
+        self._breaker = CircuitBreaker(min_delay=fail_wait_min, max_delay=fail_wait)
+        self._reconnect_task = None  # type: Optional[Future]
+        self._sender_task = None  # type: Optional[Future]
+        self._running = True
         self._flush_interval = flush_interval
-        self._fail_wait = fail_wait
+        self._probe_size = probe_size
+        self._max_batch_points = max_batch_points
+        self._spill = spill
+        self._spill_rate = spill_rate
+        self._replayed_at = monotonic()
+        self._stats_prefix = stats_prefix.encode('ascii') + b'.' if stats_prefix else None
+        self._sent = 0
+        self._dropped = 0
+        self._reconnects = 0
+        self._rejected = 0
+        self._send_time = 0.
+        self._send_time_max = 0.
+        self._bytes_written = protocol.bytes_written
+        self._encode_time = protocol.encode_time
+        self._timeouts = protocol.timeouts
+        self._datagrams = getattr(protocol, 'datagrams', None)  # type: Optional[int]
+        self._stats_sources = []  # type: List[Callable[[], Iterable[Tuple[bytes, int]]]]
+
+        if thread_safe:
+            self._bind()
+
+        if registry is not None:
+            self._start()
+
+    @property
+    def _batch_size(self) -> int:
+        return self._probe_size if self._breaker.state == CircuitBreaker.HALF_OPEN else self._max_batch_points
+
+    async def __aenter__(self) -> 'Graphite':
+        self._start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _bind(self) -> bool:
+        try:
+            loop = get_running_loop()
+        except RuntimeError:
+            return False
+
+        self._loop = loop
+        self._pending = Event()
+        self._thread_id = get_ident()
+        return True
+
+    def _start(self):
+        if self._loop is None and not self._bind():
+            return
+
+        if get_ident() == self._thread_id:
+            self._sender_task = self._loop.create_task(self._sender())
+
+    def _wake(self):
+        if self._sender_task is None and self._running:
+            self._start()
+
+        self._notify()
+
+    def _notify(self):
+        if self._pending is not None:
+            self._pending.set()
 
     async def _sender(self):
-        protocol = self._protocol
-        queue = self._queue
-        flushing = False
-        send_failed = False
+        buffer = self._buffer
 
-        while self._running or flushing:
-            metrics = []
+        while self._running:
+            lag = 0.
 
             try:
-                if send_failed:
-                    logger.debug("Sleeping for %s seconds", self._fail_wait)
-                    await sleep(self._fail_wait)
-                else:
-                    await sleep(self._flush_interval)
+                started = monotonic()
+                await sleep(self._flush_interval)
+                lag = monotonic() - started - self._flush_interval
+
+                idle = not buffer and not self._aggregations and not self._spill and self._registry is None
 
-                if not flushing:
-                    metrics.append(await queue.get())
+                if idle and not self._stats_prefix and not any(self._local_buffers):
+                    self._pending.clear()
+                    await self._pending.wait()
             except CancelledError:
                 self._running = False
 
-            while not queue.empty():
-                metrics.append(queue.get_nowait())
+            await self._flush(lag)
+
+    async def _flush(self, lag: float):
+        buffer = self._buffer
+        breaker = self._breaker
+
+        if self._local_buffers:
+            self._collect_local()
+
+        if self._registry is not None:
+            self._collect_registry()
+
+        if self._protocol.forwards_aggregations:
+            await self._forward_aggregations()
+        else:
+            self._collect_aggregations()
+
+        if buffer.dropped:
+            logger.warning("Dropping %s metrics over the limit", buffer.dropped)
+            self._dropped += buffer.dropped
+            buffer.dropped = 0
+
+        if buffer.evicted:
+            logger.warning("Spilling %s metrics over the limit", len(buffer.evicted))
+            self._spill_write(buffer.evicted)
+            buffer.evicted = []
+
+        if self._guard is not None and self._guard.rejected:
+            logger.warning("Rejecting %s points of new series over the limit", self._guard.rejected)
+            self._rejected += self._guard.rejected
+            self._guard.rejected = 0
+
+        stats = self._collect_stats(lag) if self._stats_prefix else []
+
+        if breaker.state == CircuitBreaker.OPEN:
+            if self._spill is not None and buffer:
+                self._spill_write(buffer.pop())
+
+            return
+
+        sent = 0
+
+        while buffer or stats:
+            metrics = buffer.pop(self._batch_size)
+
+            if not await self._try_send(stats + metrics, requeue=False):
+                self._requeue(metrics)
+                break
 
-            metrics_len = len(metrics)
-            off_limit = metrics_len - self._queue_size
+            stats = []
+            sent += len(metrics)
 
-            if off_limit > 0:
-                logger.warning("Dropping %s metrics over the limit", off_limit)
-                metrics = metrics[-self._queue_size:]
+        if sent:
+            logger.debug("Sent %s metrics", sent)
+            self._sent += sent
 
+        if self._spill and breaker.state != CircuitBreaker.OPEN:
+            await self._replay()
+
+    async def _send(self, metrics: List[Tuple[Union[str, bytes], int, int]]):
+        send = ensure_future(self._protocol.send(metrics))
+        started = monotonic()
+
+        try:
+            await shield(send)
+        except CancelledError:
+            self._running = False
+            await send
+        finally:
+            elapsed = monotonic() - started
+            self._send_time += elapsed
+            self._send_time_max = max(self._send_time_max, elapsed)
+
+    async def _forward_aggregations(self):
+        aggregations, self._aggregations = self._aggregations, {}
+
+        if not aggregations:
+            return
+
+        send = ensure_future(self._protocol.send_aggregations(list(aggregations.items())))
+
+        try:
             try:
-                await shield(protocol.send(metrics))
+                await shield(send)
             except CancelledError:
                 self._running = False
-                flushing = True
-            except ProtocolError as exc:
-                logger.error("%s", exc)
+                await send
+        except ProtocolError as exc:
+            logger.error("Keeping %s aggregations: %s", len(aggregations), exc)
+
+            for metric, aggregation in aggregations.items():
+                self._merge(metric, aggregation)
+
+    async def _try_send(self, metrics: List[Tuple[Union[str, bytes], int, int]], requeue: bool = True) -> bool:
+        breaker = self._breaker
+
+        try:
+            await self._send(metrics)
+        except ProtocolError as exc:
+            logger.error("%s", exc)
+
+            if requeue:
+                self._requeue(metrics)
+
+            breaker.fail()
+            logger.debug("Circuit open, reconnecting in %.3f seconds", breaker.delay)
+
+            if self._running and (not self._reconnect_task or self._reconnect_task.done()):
+                self._reconnect_task = ensure_future(self._reconnect())
+
+            return False
 
-                for metric in metrics:
-                    queue.put_nowait(metric)
+        if breaker.state != CircuitBreaker.CLOSED:
+            logger.info("Circuit closed after %s failures", breaker.failures)
+            breaker.succeed()
 
-                send_failed = True
+        return True
+
+    async def _reconnect(self):
+        breaker = self._breaker
+
+        while breaker.state == CircuitBreaker.OPEN:
+            await sleep(breaker.retry_in)
+            self._reconnects += 1
+
+            try:
+                await self._protocol.connect()
+            except ProtocolError as exc:
+                breaker.fail()
+                logger.warning("Reconnect failed, retrying in %.3f seconds: %s", breaker.delay, exc)
             else:
-                if metrics_len:
-                    logger.debug("Sent %s metrics", metrics_len)
+                breaker.half_open()
+                self._notify()
 
-                send_failed = False
-                flushing = False
+    async def _replay(self):
+        now = monotonic()
+        limit = min(int((now - self._replayed_at) * self._spill_rate), self._batch_size)
 
-    async def close(self):
-        self._sender_task.cancel()
+        if limit < 1:
+            return
+
+        self._replayed_at = now
+        metrics = self._spill.read(limit)
+
+        if not metrics:
+            return
+
+        if await self._try_send(metrics, requeue=False):
+            self._spill.commit()
+            logger.debug("Replayed %s metrics", len(metrics))
+            self._sent += len(metrics)
+        else:
+            self._spill.rollback()
+
+    def _requeue(self, metrics: List[Tuple[Union[str, bytes], int, int]]):
+        if self._spill is None:
+            for metric in metrics:
+                self._buffer.push(*metric)
+        else:
+            self._spill_write(chain(metrics, self._buffer.pop()))
+
+    def _spill_write(self, metrics: Iterable[Tuple[Union[str, bytes], int, int]]):
+        metrics = list(metrics)
 
         try:
-            await self._sender_task
-        except CancelledError:
-            pass
-        except Exception as exc:
-            logger.error("Error at %s sender task: %s", self.__class__.__name__, exc, exc_info=exc)
+            self._dropped += self._spill.write(metrics)
+        except OSError as exc:
+            logger.error("Dropping %s metrics, spill failed: %s", len(metrics), exc)
+            self._dropped += len(metrics)
+
+    def _defer(self, point: Tuple[Union[str, bytes], int, Optional[int], Optional[Type[Aggregation]], int]):
+        try:
+            buffer = self._local.buffer
+        except AttributeError:
+            buffer = self._local.buffer = LocalBuffer(self._queue_size)
+
+            with self._local_lock:
+                self._local_buffers.append(buffer)
+
+        if buffer.append(point) and self._loop:
+            try:
+                self._loop.call_soon_threadsafe(self._wake)
+            except RuntimeError as exc:
+                logger.warning("Sender loop is unavailable: %s", exc)
+
+    def _collect_local(self):
+        with self._local_lock:
+            buffers = list(self._local_buffers)
+
+        for buffer in buffers:
+            for metric, value, timestamp, aggregation, weight in buffer.drain():
+                if aggregation is None:
+                    self._push(metric, value, timestamp)
+                else:
+                    self._aggregate(metric, value, aggregation, weight)
+
+            if buffer.dropped:
+                self._buffer.dropped += buffer.dropped
+                buffer.dropped = 0
+
+            if not buffer and not buffer.thread.is_alive():
+                with self._local_lock:
+                    self._local_buffers.remove(buffer)
+
+    def _collect_aggregations(self):
+        aggregations, self._aggregations = self._aggregations, {}
+        timestamp = int(time())
+
+        for metric, aggregation in aggregations.items():
+            for suffix, value in aggregation.items():
+                name = insert_suffix(metric, suffix)
+
+                try:
+                    self._buffer.push(name, value, timestamp)
+                except OverflowError as exc:
+                    logger.error("Invalid metric %r: %s", (name, value, timestamp), exc)
+
+    def _collect_registry(self):
+        timestamp = int(time())
+
+        for metric, value in self._registry.collect():
+            try:
+                self._buffer.push(metric, value, timestamp)
+            except OverflowError as exc:
+                logger.error("Invalid metric %r: %s", (metric, value, timestamp), exc)
+
+    def _collect_stats(self, lag: float) -> List[Tuple[bytes, int, int]]:
+        protocol = self._protocol
+        bytes_written = protocol.bytes_written
+        encode_time = protocol.encode_time
+        timeouts = protocol.timeouts
+        stats = (
+            (b'queue_size', len(self._buffer)),
+            (b'sent', self._sent),
+            (b'dropped', self._dropped),
+            (b'bytes', bytes_written - self._bytes_written),
+            (b'reconnects', self._reconnects),
+            (b'timeouts', timeouts - self._timeouts),
+            (b'encode.sum.time.us', int((encode_time - self._encode_time) * 1000000)),
+            (b'send.sum.time.us', int(self._send_time * 1000000)),
+            (b'send.max.time.us', int(self._send_time_max * 1000000)),
+            (b'lag.time.us', int(max(lag, 0.) * 1000000)),
+        )
+        timestamp = int(time())
+
+        if self._datagrams is not None:
+            datagrams = protocol.datagrams
+            stats += (b'datagrams', datagrams - self._datagrams),
+            self._datagrams = datagrams
+
+        if self._guard is not None:
+            stats += (b'series', len(self._guard)), (b'series.rejected', self._rejected)
+
+        for source in self._stats_sources:
+            stats += tuple(source())
+
+        self._sent = self._dropped = self._reconnects = self._rejected = 0
+        self._send_time = self._send_time_max = 0.
+        self._bytes_written = bytes_written
+        self._encode_time = encode_time
+        self._timeouts = timeouts
+        return [(self._stats_prefix + name, value, timestamp) for name, value in stats]
+
+    async def close(self):
+        if self._sender_task is not None:
+            self._sender_task.cancel()
+
+            try:
+                await self._sender_task
+            except CancelledError:
+                pass
+            except Exception as exc:
+                logger.error("Error at %s sender task: %s", self.__class__.__name__, exc, exc_info=exc)
+
+        if self._sender_task is None or self._sender_task.cancelled():
+            self._running = False
+
+            if self._buffer or self._aggregations or self._local_buffers or self._registry is not None:
+                await self._flush(0.)
+
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+
+            try:
+                await self._reconnect_task
+            except CancelledError:
+                pass
+
+        if self._spill is not None:
+            if self._buffer or self._buffer.evicted:
+                self._spill_write(chain(self._buffer.evicted, self._buffer.pop()))
+                self._buffer.evicted = []
+
+            self._spill.close()
+        elif self._buffer:
+            logger.error("Dropping %s unsent metrics on close", len(self._buffer))
 
         self._protocol.close()
 
-    def send(self, metric: str, value: int, timestamp: Optional[int] = None):
+    def add_stats(self, source: Callable[[], Iterable[Tuple[bytes, int]]]):
+        self._stats_sources.append(source)
+
+    def send(self, metric: Union[str, bytes], value: int, timestamp: Optional[int] = None, *,
+             tags: Optional[Dict[str, str]] = None):
         if not self._running:
             logger.warning("Sender is not running, not sending")
             return
 
+        if self._sender_task is None:
+            self._start()
+
+        if not isinstance(metric, bytes):
+            metric = str(metric)
+
         try:
-            self._queue.put_nowait((str(metric), int(value), int(timestamp or time())))
-        except ValueError as exc:
+            if tags:
+                metric = self._tag(metric, tags)
+
+            value, timestamp = int(value), int(timestamp or time())
+        except (ValueError, OverflowError) as exc:
             logger.error("Invalid metric %r: %s", (metric, value, timestamp), exc)
+            return
+
+        if self._thread_safe and get_ident() != self._thread_id:
+            self._defer((metric, value, timestamp, None, 1))
+        else:
+            self._push(metric, value, timestamp)
+
+    @staticmethod
+    def _tag(metric: Union[str, bytes], tags: Dict[str, str]) -> bytes:
+        if not isinstance(metric, bytes):
+            metric = str(metric).encode('ascii')
+
+        return metric + encode_tags(tags)
+
+    def _push(self, metric: Union[str, bytes], value: int, timestamp: int):
+        if self._guard is not None:
+            metric = self._guard.admit(metric)
+
+            if metric is None:
+                return
+
+        try:
+            self._buffer.push(metric, value, timestamp)
+        except OverflowError as exc:
+            logger.error("Invalid metric %r: %s", (metric, value, timestamp), exc)
+        else:
+            self._notify()
+
+    def aggregate(self, metric: Union[str, bytes], value: int, aggregation: Type[Aggregation], weight: int = 1, *,
+                  tags: Optional[Dict[str, str]] = None):
+        if not self._running:
+            logger.warning("Sender is not running, not aggregating")
+            return
+
+        if self._sender_task is None:
+            self._start()
+
+        try:
+            if tags:
+                metric = self._tag(metric, tags)
+
+            value = int(value)
+        except ValueError as exc:
+            logger.error("Invalid metric %r: %s", (metric, value), exc)
+            return
+
+        if self._thread_safe and get_ident() != self._thread_id:
+            self._defer((metric, value, None, aggregation, weight))
+        else:
+            self._aggregate(metric, value, aggregation, weight)
+
+    def _aggregate(self, metric: Union[str, bytes], value: int, aggregation: Type[Aggregation], weight: int):
+        current = self._aggregations.get(metric)
+
+        if current is None and self._guard is not None:
+            metric = self._guard.admit(metric)
+
+            if metric is None:
+                return
+
+            current = self._aggregations.get(metric)
+
+            if current is not None and type(current) is not aggregation:
+                return
+
+        if current is None:
+            self._aggregations[metric] = aggregation(value, weight)
+            self._notify()
+        else:
+            current.add(value, weight)
+
+    def merge(self, metric: Union[str, bytes], aggregation: Aggregation):
+        if not self._running:
+            logger.warning("Sender is not running, not merging")
+            return
+
+        if self._sender_task is None:
+            self._start()
+
+        self._merge(metric, aggregation)
+
+    def _merge(self, metric: Union[str, bytes], aggregation: Aggregation):
+        current = self._aggregations.get(metric)
+
+        if current is None and self._guard is not None:
+            metric = self._guard.admit(metric)
+
+            if metric is None:
+                return
+
+            current = self._aggregations.get(metric)
+
+            if current is not None and type(current) is not type(aggregation):
+                return
+
+        if current is None:
+            self._aggregations[metric] = aggregation
+            self._notify()
+        else:
+            current.merge(aggregation)
+
+
+class NullGraphite(Graphite):
+    def __init__(self):
+        super().__init__(queue_size=1)
+
+    def _start(self):
+        pass
+
+    def send(self, metric: Union[str, bytes], value: int, timestamp: Optional[int] = None, *,
+             tags: Optional[Dict[str, str]] = None):
+        pass
+
+    def aggregate(self, metric: Union[str, bytes], value: int, aggregation: Type[Aggregation], weight: int = 1, *,
+                  tags: Optional[Dict[str, str]] = None):
+        pass
+
+    def merge(self, metric: Union[str, bytes], aggregation: Aggregation):
+        pass
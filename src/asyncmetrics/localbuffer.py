@@ -0,0 +1,43 @@
+from collections import deque
+from threading import current_thread
+from typing import Deque, List, Optional, Tuple, Type, Union
+
+from .aggregation import Aggregation
+
+__all__ = [
+    'LocalBuffer',
+]
+
+Point = Tuple[Union[str, bytes], int, Optional[int], Optional[Type[Aggregation]], int]
+
+
+class LocalBuffer:
+    def __init__(self, size: int):
+        if size < 1:
+            raise ValueError("size must be positive, not {}".format(size))
+
+        self._size = size
+        self._points = deque(maxlen=size)  # type: Deque[Point]
+        self._scheduled = False
+        self.thread = current_thread()
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def append(self, point: Point) -> bool:
+        if len(self._points) == self._size:
+            self.dropped += 1
+
+        self._points.append(point)
+
+        if self._scheduled:
+            return False
+
+        self._scheduled = True
+        return True
+
+    def drain(self) -> List[Point]:
+        self._scheduled = False
+        points = self._points
+        return [points.popleft() for _ in range(len(points))]
@@ -1,9 +1,20 @@
 from asyncio import iscoroutinefunction
 from functools import wraps
-from time import monotonic
-from typing import Callable, Optional, Union
+from random import randint
+from typing import Callable, Dict, Optional, Type, Union
 
-from .graphite import Graphite
+from .aggregation import (Aggregation, AvgAggregation, CountAggregation, HistogramAggregation, MaxAggregation,
+                          MinAggregation, SumAggregation)
+from .graphite import Graphite, NullGraphite
+from .tags import encode_tags
+
+try:
+    from time import perf_counter_ns
+except ImportError:
+    from time import perf_counter
+
+    def perf_counter_ns() -> int:
+        return int(perf_counter() * 1000000000)
 
 __all__ = [
     'AvgMetric',
@@ -11,6 +22,10 @@ __all__ = [
     'AvgNsMetric',
     'AvgUsMetric',
     'CountMetric',
+    'HistogramMetric',
+    'HistogramMsMetric',
+    'HistogramNsMetric',
+    'HistogramUsMetric',
     'MaxMetric',
     'MaxMsMetric',
     'MaxNsMetric',
@@ -26,6 +41,7 @@ __all__ = [
     'SumMsMetric',
     'SumNsMetric',
     'SumUsMetric',
+    'TimerMetric',
     'UsMetric',
     'count',
     'time',
@@ -33,6 +49,8 @@ __all__ = [
 
 
 class _MetricMeta(type):
+    _version = 0
+
     def __new__(mcs, name, bases, namespace):
         graphite = namespace.pop('graphite', None)
         prefix = namespace.pop('prefix', None)
@@ -62,6 +80,7 @@ class _MetricMeta(type):
             raise TypeError("graphite must be Graphite, not {}", type(value).__name__)
 
         setattr(cls, '_graphite', value)
+        _MetricMeta._version += 1
 
     @property
     def prefix(cls) -> str:
@@ -73,99 +92,226 @@ class _MetricMeta(type):
             raise TypeError("prefix must be str, not {}", type(value).__name__)
 
         setattr(cls, '_prefix', value)
+        _MetricMeta._version += 1
 
     @prefix.deleter
     def prefix(cls):
         if hasattr(cls, '_prefix'):
             delattr(cls, '_prefix')
+            _MetricMeta._version += 1
+
+
+class _Timer:
+    __slots__ = ('_metric', '_start')
+
+    def __init__(self, metric: 'Metric'):
+        self._metric = metric
+        self._start = 0
+
+    def __enter__(self) -> '_Timer':
+        self._start = perf_counter_ns() if self._metric._sample() else 0
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and self._start:
+            metric = self._metric
+            metric._record(metric._calculate_time(self._start, perf_counter_ns()), metric._interval)
+
+    async def __aenter__(self) -> '_Timer':
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.__exit__(exc_type, exc_value, traceback)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> '_NullTimer':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    async def __aenter__(self) -> '_NullTimer':
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        pass
 
 
 class Metric(metaclass=_MetricMeta):
-    def __init__(self, metric: str, *, graphite: Optional[Graphite] = None):
+    aggregation = None  # type: Optional[Type[Aggregation]]
+    _divisor = 1
+
+    def __init__(self, metric: str, *, graphite: Optional[Graphite] = None, sample_rate: float = 1.,
+                 tags: Optional[Dict[str, str]] = None):
         if not isinstance(metric, str):
             raise TypeError("metric must be str, not {}", type(metric).__name__)
 
         if graphite and not isinstance(graphite, Graphite):
             raise TypeError("graphite must be Graphite, not {}", type(graphite).__name__)
 
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be in (0, 1], not {}".format(sample_rate))
+
         self._metric = metric
         self._graphite = graphite
+        self._tags = encode_tags(tags) if tags else b''
+        self._interval = max(1, int(round(1 / sample_rate)))
+        self._countdown = randint(1, self._interval)
+        self._version = -1
+        self._target = None  # type: Optional[Graphite]
+        self._name = b''
 
     @property
     def metric(self) -> str:
         return '.'.join(x for x in (type(self).prefix, self._metric) if x)
 
-    def _calculate_time(self, start: float, stop: float) -> int:
-        if isinstance(self, MsMetric):
-            threshold = 3
-        elif isinstance(self, UsMetric):
-            threshold = 6
-        else:
-            threshold = 9
+    def _calculate_time(self, start: int, stop: int) -> int:
+        divisor = self._divisor
+        return (stop - start + divisor // 2) // divisor
+
+    def _resolve(self):
+        self._target = self._graphite or type(self).graphite
+        self._name = self.metric.encode('ascii') + self._tags
+        self._version = _MetricMeta._version
+
+    @property
+    def sample_rate(self) -> float:
+        return 1 / self._interval
+
+    @property
+    def disabled(self) -> bool:
+        return isinstance(self._graphite or getattr(type(self), '_graphite', None), NullGraphite)
+
+    def _sample(self) -> bool:
+        self._countdown -= 1
+
+        if self._countdown:
+            return False
+
+        self._countdown = self._interval
+        return True
 
-        return int(round(stop - start, threshold) * 10 ** threshold)
+    def _record(self, value: int, weight: int):
+        if self._version != _MetricMeta._version:
+            self._resolve()
+
+        if self.aggregation:
+            self._target.aggregate(self._name, value, self.aggregation, weight)
+        else:
+            self._target.send(self._name, value)
 
     def send(self, value: int, timestamp: Optional[int] = None):
-        graphite = self._graphite or type(self).graphite
-        graphite.send(self.metric, value, timestamp)
+        if self._version != _MetricMeta._version:
+            self._resolve()
+
+        if self.aggregation and timestamp is None:
+            self._target.aggregate(self._name, value, self.aggregation)
+        else:
+            self._target.send(self._name, value, timestamp)
 
     def count(self, func: Callable) -> Callable:
+        if self.disabled:
+            return func
+
+        weight = self._interval
+        value = 1 if self.aggregation else weight
+
         @wraps(func)
         def deco(*args, **kwargs):
-            self.send(1)
+            self._countdown -= 1
+
+            if not self._countdown:
+                self._countdown = weight
+                self._record(value, weight)
+
             return func(*args, **kwargs)
         return deco
 
     def time(self, func: Callable) -> Callable:
+        if self.disabled:
+            return func
+
+        weight = self._interval
+
         if iscoroutinefunction(func):
             @wraps(func)
             async def deco(*args, **kwargs):
-                start = monotonic()
+                self._countdown -= 1
+
+                if self._countdown:
+                    return await func(*args, **kwargs)
+
+                self._countdown = weight
+                start = perf_counter_ns()
                 ret = await func(*args, **kwargs)
-                stop = monotonic()
-                self.send(self._calculate_time(start, stop))
+                self._record(self._calculate_time(start, perf_counter_ns()), weight)
                 return ret
         else:
             @wraps(func)
             def deco(*args, **kwargs):
-                start = monotonic()
+                self._countdown -= 1
+
+                if self._countdown:
+                    return func(*args, **kwargs)
+
+                self._countdown = weight
+                start = perf_counter_ns()
                 ret = func(*args, **kwargs)
-                stop = monotonic()
-                self.send(self._calculate_time(start, stop))
+                self._record(self._calculate_time(start, perf_counter_ns()), weight)
                 return ret
         return deco
 
+    def timer(self) -> Union[_Timer, _NullTimer]:
+        return _NullTimer() if self.disabled else _Timer(self)
+
 
 class MaxMetric(Metric):
+    aggregation = MaxAggregation
+
     @property
     def metric(self) -> str:
         return super().metric + '.max'
 
 
 class MinMetric(Metric):
+    aggregation = MinAggregation
+
     @property
     def metric(self) -> str:
         return super().metric + '.min'
 
 
 class AvgMetric(Metric):
+    aggregation = AvgAggregation
+
     @property
     def metric(self) -> str:
         return super().metric + '.avg'
 
 
 class SumMetric(Metric):
+    aggregation = SumAggregation
+
     @property
     def metric(self) -> str:
         return super().metric + '.sum'
 
 
 class CountMetric(Metric):
+    aggregation = CountAggregation
+
     @property
     def metric(self) -> str:
         return super().metric + '.count'
 
 
+class HistogramMetric(Metric):
+    aggregation = HistogramAggregation
+
+
 class _TimeMetric(Metric):
     @property
     def metric(self) -> str:
@@ -173,12 +319,16 @@ class _TimeMetric(Metric):
 
 
 class MsMetric(_TimeMetric):
+    _divisor = 1000000
+
     @property
     def metric(self) -> str:
         return super().metric + '.ms'
 
 
 class UsMetric(_TimeMetric):
+    _divisor = 1000
+
     @property
     def metric(self) -> str:
         return super().metric + '.us'
@@ -206,6 +356,10 @@ class SumMsMetric(MsMetric, SumMetric):
     pass
 
 
+class HistogramMsMetric(MsMetric, HistogramMetric):
+    pass
+
+
 class MaxUsMetric(UsMetric, MaxMetric):
     pass
 
@@ -222,6 +376,10 @@ class SumUsMetric(UsMetric, SumMetric):
     pass
 
 
+class HistogramUsMetric(UsMetric, HistogramMetric):
+    pass
+
+
 class MaxNsMetric(NsMetric, MaxMetric):
     pass
 
@@ -238,15 +396,25 @@ class SumNsMetric(NsMetric, SumMetric):
     pass
 
 
-def count(func: Union[Callable, str], *, klass: _MetricMeta = CountMetric) -> Callable[[Callable], Callable]:
+class HistogramNsMetric(NsMetric, HistogramMetric):
+    pass
+
+
+class TimerMetric(HistogramUsMetric):
+    pass
+
+
+def count(func: Union[Callable, str], *, klass: _MetricMeta = CountMetric, sample_rate: float = 1.,
+          tags: Optional[Dict[str, str]] = None) -> Callable[[Callable], Callable]:
     if isinstance(func, Callable):
-        return klass('{}.{}'.format(func.__module__, func.__qualname__)).count(func)
+        return klass('{}.{}'.format(func.__module__, func.__qualname__), sample_rate=sample_rate, tags=tags).count(func)
     else:
-        return klass(func).count
+        return klass(func, sample_rate=sample_rate, tags=tags).count
 
 
-def time(func: Union[Callable, str], *, klass: _MetricMeta = NsMetric) -> Callable[[Callable], Callable]:
+def time(func: Union[Callable, str], *, klass: _MetricMeta = NsMetric, sample_rate: float = 1.,
+         tags: Optional[Dict[str, str]] = None) -> Callable[[Callable], Callable]:
     if isinstance(func, Callable):
-        return klass('{}.{}'.format(func.__module__, func.__qualname__)).time(func)
+        return klass('{}.{}'.format(func.__module__, func.__qualname__), sample_rate=sample_rate, tags=tags).time(func)
     else:
-        return klass(func).time
+        return klass(func, sample_rate=sample_rate, tags=tags).time
@@ -1,15 +1,27 @@
+from .consistenthash import *
 from .gziptcp import *
 from .gziptcpssl import *
+from .gzipunix import *
+from .partialunix import *
+from .pickletcp import *
+from .pickletcpssl import *
 from .plaintcp import *
 from .plaintcpssl import *
 from .plainudp import *
+from .plainunix import *
 from .protocolerror import *
 
 __all__ = [
+    *consistenthash.__all__,
     *gziptcp.__all__,
     *gziptcpssl.__all__,
+    *gzipunix.__all__,
+    *partialunix.__all__,
+    *pickletcp.__all__,
+    *pickletcpssl.__all__,
     *plaintcp.__all__,
     *plaintcpssl.__all__,
     *plainudp.__all__,
+    *plainunix.__all__,
     *protocolerror.__all__,
 ]
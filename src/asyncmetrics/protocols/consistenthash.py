@@ -0,0 +1,138 @@
+from asyncio import gather
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from ..circuitbreaker import CircuitBreaker
+from .hashring import HashRing
+from .protocol import Protocol
+from .protocolerror import ProtocolError
+
+__all__ = [
+    'ConsistentHash',
+]
+
+
+class ConsistentHash(Protocol):
+    _routes_limit = 100000
+
+    def __init__(self, protocols: Sequence[Protocol], *, instances: Optional[Sequence[Optional[str]]] = None,
+                 replica_count: int = 100, fail_wait: float = 60., fail_wait_min: float = .5):
+        super().__init__()
+
+        if not protocols:
+            raise ValueError("protocols must not be empty")
+
+        if instances is None:
+            instances = [None] * len(protocols)
+        elif len(instances) != len(protocols):
+            raise ValueError("instances must match protocols, got {} for {}".format(len(instances), len(protocols)))
+
+        self._protocols = {}  # type: Dict[Tuple[str, Optional[str]], Protocol]
+
+        for protocol, instance in zip(protocols, instances):
+            node = protocol._host, instance
+
+            if node in self._protocols:
+                raise ValueError("duplicate destination {!r}, set distinct instances".format(node))
+
+            self._protocols[node] = protocol
+
+        self._breakers = {
+            node: CircuitBreaker(min_delay=fail_wait_min, max_delay=fail_wait) for node in self._protocols
+        }  # type: Dict[Tuple[str, Optional[str]], CircuitBreaker]
+        self._ring = HashRing(self._protocols, replica_count=replica_count)
+        self._routes = {}  # type: Dict[Union[str, bytes], Tuple[Tuple[str, Optional[str]], ...]]
+
+    @property
+    def encode_time(self) -> float:
+        return sum(protocol.encode_time for protocol in self._protocols.values())
+
+    @property
+    def bytes_written(self) -> int:
+        return sum(protocol.bytes_written for protocol in self._protocols.values())
+
+    @property
+    def timeouts(self) -> int:
+        return sum(protocol.timeouts for protocol in self._protocols.values())
+
+    async def connect(self):
+        results = await gather(*(protocol.connect() for protocol in self._protocols.values()), return_exceptions=True)
+
+        for node, result in zip(self._protocols, results):
+            if isinstance(result, ProtocolError):
+                self._breakers[node].fail()
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                self._breakers[node].succeed()
+
+        if all(isinstance(result, ProtocolError) for result in results):
+            raise ProtocolError("All {} destinations failed".format(len(results)))
+
+    async def send(self, dataset: Iterable[Tuple[Union[str, bytes], int, int]]):
+        dead = self._dead()
+
+        if len(dead) == len(self._protocols):
+            raise ProtocolError("All {} destinations are down".format(len(dead)))
+
+        shards = self._shard(dataset, dead)
+
+        while shards:
+            results = await gather(
+                *(self._protocols[node].send(points) for node, points in shards.items()),
+                return_exceptions=True,
+            )
+            failed = []
+
+            for (node, points), result in zip(shards.items(), results):
+                breaker = self._breakers[node]
+
+                if isinstance(result, ProtocolError):
+                    breaker.fail()
+                    dead.add(node)
+                    failed.extend(points)
+                elif isinstance(result, BaseException):
+                    raise result
+                elif breaker.state != CircuitBreaker.CLOSED:
+                    breaker.succeed()
+
+            if len(dead) == len(self._protocols):
+                raise ProtocolError("All {} destinations failed".format(len(dead)))
+
+            shards = self._shard(failed, dead)
+
+    def close(self):
+        for protocol in self._protocols.values():
+            protocol.close()
+
+    def _dead(self) -> Set[Tuple[str, Optional[str]]]:
+        return {
+            node for node, breaker in self._breakers.items()
+            if breaker.state == CircuitBreaker.OPEN and breaker.retry_in > 0
+        }
+
+    def _shard(self, dataset: Iterable[Tuple[Union[str, bytes], int, int]],
+               dead: Set[Tuple[str, Optional[str]]]) -> Dict[Tuple[str, Optional[str]], List[Tuple[Union[str, bytes], int, int]]]:
+        shards = {}
+
+        for point in dataset:
+            nodes = self._route(point[0])
+            node = nodes[0]
+
+            if node in dead:
+                node = next(x for x in nodes if x not in dead)
+
+            shards.setdefault(node, []).append(point)
+
+        return shards
+
+    def _route(self, metric: Union[str, bytes]) -> Tuple[Tuple[str, Optional[str]], ...]:
+        nodes = self._routes.get(metric)
+
+        if nodes is None:
+            if len(self._routes) >= self._routes_limit:
+                self._routes.clear()
+
+            key = metric.decode('ascii') if isinstance(metric, bytes) else metric
+            nodes = self._routes[metric] = tuple(self._ring.iter(key))
+
+        return nodes
@@ -1,5 +1,6 @@
-from gzip import compress
-from typing import Iterable, Tuple
+from itertools import chain
+from typing import Iterable, Iterator, Tuple, Union
+from zlib import DEFLATED, MAX_WBITS, compressobj
 
 from .plain import Plain
 
@@ -10,6 +11,28 @@ __all__ = [
 
 # noinspection PyAbstractClass
 class Gzip(Plain):
-    def _encode(self, dataset: Iterable[Tuple[str, int, int]]) -> bytes:
-        data = super()._encode(dataset)
-        return compress(data)
+    def __init__(self, *args, gzip_level: int = 1, gzip_min_size: int = 256, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._gzip_level = gzip_level
+        self._gzip_min_size = gzip_min_size
+
+    def _encode(self, dataset: Iterable[Tuple[Union[str, bytes], int, int]]) -> bytes:
+        return b''.join(self._iter_encode(dataset))
+
+    def _iter_encode(self, dataset: Iterable[Tuple[Union[str, bytes], int, int]]) -> Iterator[bytes]:
+        chunks = super()._iter_encode(dataset)
+        first = next(chunks, b'')
+
+        if not first:
+            return
+
+        level = self._gzip_level if len(first) >= self._gzip_min_size else 0
+        compressor = compressobj(level, DEFLATED, MAX_WBITS | 16)
+
+        for chunk in chain((first,), chunks):
+            data = compressor.compress(chunk)
+
+            if data:
+                yield data
+
+        yield compressor.flush()
@@ -0,0 +1,10 @@
+from .gzip import Gzip
+from .unix import Unix
+
+__all__ = [
+    'GzipUnix',
+]
+
+
+class GzipUnix(Gzip, Unix):
+    pass
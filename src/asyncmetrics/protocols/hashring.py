@@ -0,0 +1,63 @@
+from bisect import bisect_left, insort
+from hashlib import md5
+from typing import Hashable, Iterable, Iterator, List, Tuple
+
+__all__ = [
+    'HashRing',
+]
+
+
+class HashRing:
+    def __init__(self, nodes: Iterable[Hashable] = (), *, replica_count: int = 100):
+        self._replica_count = replica_count
+        self._ring = []  # type: List[Tuple[int, Hashable]]
+        self._nodes = []  # type: List[Hashable]
+
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    @staticmethod
+    def _position(key: str) -> int:
+        return int(md5(key.encode('utf-8')).hexdigest()[:4], 16)
+
+    def add(self, node: Hashable):
+        if node in self._nodes:
+            raise ValueError("node {!r} is already in the ring".format(node))
+
+        positions = {position for position, _ in self._ring}
+
+        for i in range(self._replica_count):
+            position = self._position('{}:{}'.format(node, i))
+
+            while position in positions:
+                position += 1
+
+            positions.add(position)
+            insort(self._ring, (position, node))
+
+        self._nodes.append(node)
+
+    def get(self, key: str) -> Hashable:
+        return next(self.iter(key))
+
+    def iter(self, key: str) -> Iterator[Hashable]:
+        ring = self._ring
+
+        if not ring:
+            raise LookupError("ring is empty")
+
+        index = bisect_left(ring, (self._position(key),))
+        seen = set()
+
+        for i in range(len(ring)):
+            _, node = ring[(index + i) % len(ring)]
+
+            if node not in seen:
+                seen.add(node)
+                yield node
+
+                if len(seen) == len(self._nodes):
+                    return
@@ -0,0 +1,108 @@
+from itertools import islice
+from struct import Struct
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+from ..aggregation import (Aggregation, AvgAggregation, CountAggregation, HistogramAggregation, MaxAggregation,
+                           MinAggregation, SumAggregation)
+from .protocol import Protocol
+from .protocolerror import ProtocolError
+
+__all__ = [
+    'Partial',
+]
+
+_frame = Struct('<L')
+_header = Struct('<BH')
+_point = Struct('<qq')
+_length = Struct('<H')
+_states = {}  # type: Dict[int, Struct]
+_kinds = (None, MaxAggregation, MinAggregation, SumAggregation, CountAggregation, AvgAggregation, HistogramAggregation)
+
+
+def _state(count: int) -> Struct:
+    try:
+        return _states[count]
+    except KeyError:
+        state = _states[count] = Struct('<{}q'.format(count))
+        return state
+
+
+# noinspection PyAbstractClass
+class Partial(Protocol):
+    _block_size = 1024
+    forwards_aggregations = True
+
+    @staticmethod
+    def decode(payload: bytes) -> Iterator[Tuple[bytes, Union[Tuple[int, int], Aggregation]]]:
+        offset = 0
+
+        while offset < len(payload):
+            kind, length = _header.unpack_from(payload, offset)
+            offset += _header.size
+            metric = payload[offset:offset + length]
+            offset += length
+
+            if not kind:
+                yield metric, _point.unpack_from(payload, offset)
+                offset += _point.size
+                continue
+
+            try:
+                aggregation = _kinds[kind]
+            except IndexError:
+                raise ValueError("Unknown aggregation kind {}".format(kind)) from None
+
+            count, = _length.unpack_from(payload, offset)
+            offset += _length.size
+            state = _state(count)
+            yield metric, aggregation.from_state(state.unpack_from(payload, offset))
+            offset += state.size
+
+    async def send_aggregations(self, aggregations: List[Tuple[Union[str, bytes], Aggregation]]):
+        try:
+            if not self._writer:
+                self._writer = await self._open()
+
+            for data in self._iter_frames(self._encode_aggregation(*x) for x in aggregations):
+                await self._write(data)
+                self._bytes_written += len(data)
+        except Exception as exc:
+            self.close()
+            raise ProtocolError(*exc.args) from exc
+
+    def _encode(self, dataset: Iterable[Tuple[Union[str, bytes], int, int]]) -> bytes:
+        return b''.join(self._iter_encode(dataset))
+
+    def _iter_encode(self, dataset: Iterable[Tuple[Union[str, bytes], int, int]]) -> Iterator[bytes]:
+        return self._iter_frames(self._encode_point(*x) for x in dataset)
+
+    def _iter_frames(self, records: Iterable[bytes]) -> Iterator[bytes]:
+        records = iter(records)
+
+        while True:
+            payload = b''.join(islice(records, self._block_size))
+
+            if not payload:
+                break
+
+            yield _frame.pack(len(payload)) + payload
+
+    @staticmethod
+    def _encode_point(metric: Union[str, bytes], value: int, timestamp: int) -> bytes:
+        if not isinstance(metric, bytes):
+            metric = metric.encode('ascii')
+
+        return _header.pack(0, len(metric)) + metric + _point.pack(value, timestamp)
+
+    @staticmethod
+    def _encode_aggregation(metric: Union[str, bytes], aggregation: Aggregation) -> bytes:
+        if not isinstance(metric, bytes):
+            metric = metric.encode('ascii')
+
+        state = aggregation.state
+        return b''.join((
+            _header.pack(_kinds.index(type(aggregation)), len(metric)),
+            metric,
+            _length.pack(len(state)),
+            _state(len(state)).pack(*state),
+        ))
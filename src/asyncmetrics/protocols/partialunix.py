@@ -0,0 +1,10 @@
+from .partial import Partial
+from .unix import Unix
+
+__all__ = [
+    'PartialUnix',
+]
+
+
+class PartialUnix(Partial, Unix):
+    pass
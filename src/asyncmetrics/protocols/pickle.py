@@ -0,0 +1,46 @@
+from itertools import islice
+from pickle import dumps
+from struct import pack
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from .protocol import Protocol
+
+__all__ = [
+    'Pickle',
+]
+
+
+# noinspection PyAbstractClass
+class Pickle(Protocol):
+    _block_size = 1024
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 2004, *, max_frame_size: int = 1048576, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self._max_frame_size = max_frame_size
+
+    def _encode(self, dataset: Iterable[Tuple[Union[str, bytes], int, int]]) -> bytes:
+        return b''.join(self._iter_encode(dataset))
+
+    def _iter_encode(self, dataset: Iterable[Tuple[Union[str, bytes], int, int]]) -> Iterator[bytes]:
+        dataset = iter(dataset)
+
+        while True:
+            block = [
+                (metric.decode('ascii') if isinstance(metric, bytes) else metric, (timestamp, value))
+                for metric, value, timestamp in islice(dataset, self._block_size)
+            ]
+
+            if not block:
+                break
+
+            yield from self._frames(block)
+
+    def _frames(self, block: List[Tuple[str, Tuple[int, int]]]) -> Iterator[bytes]:
+        payload = dumps(block, protocol=2)
+
+        if len(payload) + 4 > self._max_frame_size and len(block) > 1:
+            half = len(block) // 2
+            yield from self._frames(block[:half])
+            yield from self._frames(block[half:])
+        else:
+            yield pack('!L', len(payload)) + payload
@@ -0,0 +1,10 @@
+from .pickle import Pickle
+from .tcp import Tcp
+
+__all__ = [
+    'PickleTcp',
+]
+
+
+class PickleTcp(Pickle, Tcp):
+    pass
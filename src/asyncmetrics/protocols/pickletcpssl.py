@@ -0,0 +1,10 @@
+from .pickle import Pickle
+from .tcpssl import TcpSsl
+
+__all__ = [
+    'PickleTcpSsl',
+]
+
+
+class PickleTcpSsl(Pickle, TcpSsl):
+    pass
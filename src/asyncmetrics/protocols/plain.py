@@ -1,4 +1,5 @@
-from typing import Iterable, Tuple
+from itertools import islice
+from typing import Iterable, Iterator, Tuple, Union
 
 from .protocol import Protocol
 
@@ -9,5 +10,55 @@ __all__ = [
 
 # noinspection PyAbstractClass
 class Plain(Protocol):
-    def _encode(self, dataset: Iterable[Tuple[str, int, int]]) -> bytes:
-        return ''.join('{} {} {}\n'.format(*tpl) for tpl in dataset).encode('ascii')
+    _block_size = 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._buffer = bytearray()
+
+    def _encode(self, dataset: Iterable[Tuple[Union[str, bytes], int, int]]) -> bytes:
+        return b''.join(self._iter_encode(dataset))
+
+    def _iter_encode(self, dataset: Iterable[Tuple[Union[str, bytes], int, int]]) -> Iterator[bytes]:
+        buffer = self._buffer
+
+        if buffer is None:
+            buffer = bytearray()
+        else:
+            self._buffer = None
+
+        max_batch_bytes = self._max_batch_bytes
+        dataset = iter(dataset)
+
+        try:
+            while True:
+                block = list(islice(dataset, self._block_size))
+
+                if not block:
+                    break
+
+                try:
+                    buffer += b''.join([b'%b %d %d\n' % point for point in block])
+                except TypeError:
+                    buffer += b''.join([
+                        b'%b %d %d\n' % (metric if isinstance(metric, bytes) else metric.encode('ascii'), value, ts)
+                        for metric, value, ts in block
+                    ])
+
+                while len(buffer) > max_batch_bytes:
+                    cut = buffer.rfind(b'\n', 0, max_batch_bytes) + 1 or buffer.find(b'\n') + 1
+
+                    if cut == len(buffer):
+                        break
+
+                    data = bytes(buffer[:cut])
+                    del buffer[:cut]
+                    yield data
+
+            if buffer:
+                data = bytes(buffer)
+                del buffer[:]
+                yield data
+        finally:
+            del buffer[:]
+            self._buffer = buffer
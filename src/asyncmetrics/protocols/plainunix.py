@@ -0,0 +1,10 @@
+from .plain import Plain
+from .unix import Unix
+
+__all__ = [
+    'PlainUnix',
+]
+
+
+class PlainUnix(Plain, Unix):
+    pass
@@ -1,5 +1,9 @@
-from asyncio import StreamWriter
-from typing import Iterable, Tuple
+from asyncio import StreamWriter, TimeoutError, get_event_loop, wait_for
+from concurrent.futures import Executor
+from time import perf_counter
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from ..aggregation import Aggregation
 
 from .protocolerror import ProtocolError
 
@@ -9,32 +13,119 @@ __all__ = [
 
 
 class Protocol:
-    def __init__(self, host: str = '127.0.0.1', port: int = 2003):
+    forwards_aggregations = False
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 2003, *, max_batch_bytes: int = 65536,
+                 executor: Optional[Executor] = None, executor_threshold: int = 10000,
+                 connect_timeout: Optional[float] = 10., write_timeout: Optional[float] = 10.,
+                 write_buffer_size: Optional[int] = None):
         self._host = host
         self._port = port
+        self._max_batch_bytes = max_batch_bytes
+        self._executor = executor
+        self._executor_threshold = executor_threshold
+        self._connect_timeout = connect_timeout
+        self._write_timeout = write_timeout
+        self._write_buffer_size = write_buffer_size
+        self._encode_time = 0.
+        self._bytes_written = 0
+        self._timeouts = 0
         self._writer = None
 
-    async def send(self, dataset: Iterable[Tuple[str, int, int]]):
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_writer'] = None
+        return state
+
+    @property
+    def encode_time(self) -> float:
+        return self._encode_time
+
+    @property
+    def bytes_written(self) -> int:
+        return self._bytes_written
+
+    @property
+    def timeouts(self) -> int:
+        return self._timeouts
+
+    async def connect(self):
+        if self._writer:
+            return
+
+        try:
+            self._writer = await self._open()
+        except Exception as exc:
+            raise ProtocolError(*exc.args) from exc
+
+    async def send(self, dataset: Sequence[Tuple[str, int, int]]):
         try:
             if not self._writer:
-                self._writer = await self._connect()
+                self._writer = await self._open()
+
+            if self._executor and len(dataset) >= self._executor_threshold:
+                start = perf_counter()
+                chunks = iter(await get_event_loop().run_in_executor(self._executor, self._encode_chunks, dataset))
+                self._encode_time += perf_counter() - start
+            else:
+                chunks = self._iter_encode(dataset)
 
-            data = self._encode(dataset)
-            await self._write(data)
+            while True:
+                start = perf_counter()
+                data = next(chunks, None)
+                self._encode_time += perf_counter() - start
+
+                if data is None:
+                    break
+
+                await self._write(data)
+                self._bytes_written += len(data)
         except Exception as exc:
             self.close()
             raise ProtocolError(*exc.args) from exc
 
+    async def send_aggregations(self, aggregations: List[Tuple[Union[str, bytes], Aggregation]]):
+        raise NotImplementedError
+
     def close(self):
         if self._writer:
             self._writer.close()
             self._writer = None
 
+    async def _open(self) -> StreamWriter:
+        try:
+            writer = await wait_for(self._connect(), self._connect_timeout)
+        except TimeoutError:
+            self._timeouts += 1
+            raise ProtocolError("Connect timed out after {} seconds".format(self._connect_timeout)) from None
+
+        transport = getattr(writer, 'transport', None)
+
+        if transport is not None and self._write_buffer_size is not None:
+            transport.set_write_buffer_limits(high=self._write_buffer_size)
+
+        return writer
+
     async def _connect(self) -> StreamWriter:
         raise NotImplementedError
 
+    async def _drain(self):
+        try:
+            await wait_for(self._writer.drain(), self._write_timeout)
+        except TimeoutError:
+            self._timeouts += 1
+            self._writer.transport.abort()
+            raise ProtocolError("Write timed out after {} seconds".format(self._write_timeout)) from None
+
     async def _write(self, data: bytes):
         self._writer.write(data)
 
     def _encode(self, dataset: Iterable[Tuple[str, int, int]]) -> bytes:
         raise NotImplementedError
+
+    def _iter_encode(self, dataset: Iterable[Tuple[str, int, int]]) -> Iterator[bytes]:
+        yield self._encode(dataset)
+
+    def _encode_chunks(self, dataset: Iterable[Tuple[str, int, int]]) -> List[bytes]:
+        return list(self._iter_encode(dataset))
@@ -1,4 +1,6 @@
 from asyncio import StreamWriter, open_connection
+from socket import IPPROTO_TCP, SOL_SOCKET, SO_KEEPALIVE, SO_SNDBUF, TCP_NODELAY
+from typing import Optional
 
 from .protocol import Protocol
 
@@ -9,10 +11,30 @@ __all__ = [
 
 # noinspection PyAbstractClass
 class Tcp(Protocol):
+    def __init__(self, *args, nodelay: bool = True, keepalive: bool = True, send_buffer_size: Optional[int] = None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self._nodelay = nodelay
+        self._keepalive = keepalive
+        self._send_buffer_size = send_buffer_size
+
     async def _connect(self) -> StreamWriter:
         _, writer = await open_connection(self._host, self._port)
+        self._tune(writer)
         return writer
 
+    def _tune(self, writer: StreamWriter):
+        sock = writer.get_extra_info('socket')
+
+        if sock is None:
+            return
+
+        sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, int(self._nodelay))
+        sock.setsockopt(SOL_SOCKET, SO_KEEPALIVE, int(self._keepalive))
+
+        if self._send_buffer_size:
+            sock.setsockopt(SOL_SOCKET, SO_SNDBUF, self._send_buffer_size)
+
     async def _write(self, data: bytes):
         await super()._write(data)
-        await self._writer.drain()
+        await self._drain()
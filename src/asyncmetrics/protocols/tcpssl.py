@@ -24,4 +24,5 @@ class TcpSsl(Tcp):
             context.load_cert_chain(self._ssl_crt, self._ssl_key, self._ssl_password)
 
         _, writer = await open_connection(self._host, self._port, ssl=context)
+        self._tune(writer)
         return writer
@@ -1,10 +1,28 @@
 from asyncio import DatagramProtocol, StreamWriter, get_event_loop
+from logging import getLogger
+from typing import Iterable, Tuple
 
 from .protocol import Protocol
 
+logger = getLogger(__package__)
+
 
 # noinspection PyAbstractClass
 class Udp(Protocol):
+    def __init__(self, *args, mtu: int = 1432, **kwargs):
+        kwargs['max_batch_bytes'] = min(kwargs.get('max_batch_bytes', mtu), mtu)
+        super().__init__(*args, **kwargs)
+        self._datagrams = 0
+
+    @property
+    def datagrams(self) -> int:
+        return self._datagrams
+
+    async def send(self, dataset: Iterable[Tuple[str, int, int]]):
+        datagrams = self._datagrams
+        await super().send(dataset)
+        logger.debug("Sent %s datagrams", self._datagrams - datagrams)
+
     async def _connect(self) -> StreamWriter:
         writer, _ = await get_event_loop().create_datagram_endpoint(
             protocol_factory=DatagramProtocol,
@@ -14,3 +32,7 @@ class Udp(Protocol):
         writer.write = writer.sendto
         # noinspection PyTypeChecker
         return writer
+
+    async def _write(self, data: bytes):
+        self._writer.sendto(data)
+        self._datagrams += 1
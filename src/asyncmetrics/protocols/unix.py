@@ -0,0 +1,22 @@
+from asyncio import StreamWriter, open_unix_connection
+
+from .protocol import Protocol
+
+__all__ = [
+    'Unix',
+]
+
+
+# noinspection PyAbstractClass
+class Unix(Protocol):
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self._path = path
+
+    async def _connect(self) -> StreamWriter:
+        _, writer = await open_unix_connection(self._path)
+        return writer
+
+    async def _write(self, data: bytes):
+        await super()._write(data)
+        await self._drain()
@@ -0,0 +1,155 @@
+from asyncio import iscoroutinefunction
+from functools import wraps
+from logging import getLogger
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from .aggregation import Aggregation
+from .tags import encode_tags, insert_suffix
+
+__all__ = [
+    'Aggregate',
+    'CallbackGauge',
+    'Counter',
+    'Gauge',
+    'Registry',
+]
+
+logger = getLogger(__package__)
+
+
+class Counter:
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name: bytes):
+        self.name = name
+        self.value = 0
+
+    def inc(self, value: int = 1):
+        self.value += value
+
+    def count(self, func: Callable) -> Callable:
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def deco(*args, **kwargs):
+                self.value += 1
+                return await func(*args, **kwargs)
+        else:
+            @wraps(func)
+            def deco(*args, **kwargs):
+                self.value += 1
+                return func(*args, **kwargs)
+        return deco
+
+    def collect(self) -> List[Tuple[bytes, int]]:
+        value, self.value = self.value, 0
+        return [(self.name, value)]
+
+
+class Gauge:
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name: bytes):
+        self.name = name
+        self.value = None  # type: Optional[int]
+
+    def set(self, value: int):
+        self.value = value
+
+    def inc(self, value: int = 1):
+        self.value = (self.value or 0) + value
+
+    def dec(self, value: int = 1):
+        self.value = (self.value or 0) - value
+
+    def collect(self) -> List[Tuple[bytes, int]]:
+        return [] if self.value is None else [(self.name, int(self.value))]
+
+
+class CallbackGauge:
+    __slots__ = ('name', 'callback')
+
+    def __init__(self, name: bytes, callback: Callable[[], int]):
+        self.name = name
+        self.callback = callback
+
+    def collect(self) -> List[Tuple[bytes, int]]:
+        try:
+            value = self.callback()
+        except Exception as exc:
+            logger.error("Error at %s callback: %s", self.name.decode('ascii'), exc, exc_info=exc)
+            return []
+
+        return [] if value is None else [(self.name, int(value))]
+
+
+class Aggregate:
+    __slots__ = ('name', 'aggregation', '_current')
+
+    def __init__(self, name: bytes, aggregation: Type[Aggregation]):
+        self.name = name
+        self.aggregation = aggregation
+        self._current = None  # type: Optional[Aggregation]
+
+    def add(self, value: int, weight: int = 1):
+        if self._current is None:
+            self._current = self.aggregation(value, weight)
+        else:
+            self._current.add(value, weight)
+
+    def collect(self) -> List[Tuple[bytes, int]]:
+        current, self._current = self._current, None
+
+        if current is None:
+            return []
+
+        return [(insert_suffix(self.name, suffix), value) for suffix, value in current.items()]
+
+
+class Registry:
+    def __init__(self, prefix: str = ''):
+        self._prefix = prefix.encode('ascii') + b'.' if prefix else b''
+        self._metrics = {}  # type: Dict[bytes, object]
+
+    def __len__(self) -> int:
+        return len(self._metrics)
+
+    def counter(self, name: str, *, tags: Optional[Dict[str, str]] = None) -> Counter:
+        return self._register(Counter, self._name(name, tags))
+
+    def gauge(self, name: str, *, tags: Optional[Dict[str, str]] = None) -> Gauge:
+        return self._register(Gauge, self._name(name, tags))
+
+    def callback(self, name: str, callback: Callable[[], int], *,
+                 tags: Optional[Dict[str, str]] = None) -> CallbackGauge:
+        return self._register(CallbackGauge, self._name(name, tags), callback)
+
+    def aggregate(self, name: str, aggregation: Type[Aggregation], *,
+                  tags: Optional[Dict[str, str]] = None) -> Aggregate:
+        return self._register(Aggregate, self._name(name, tags), aggregation)
+
+    def remove(self, name: str, *, tags: Optional[Dict[str, str]] = None):
+        self._metrics.pop(self._name(name, tags), None)
+
+    def collect(self) -> List[Tuple[bytes, int]]:
+        dataset = []
+
+        for metric in list(self._metrics.values()):
+            dataset.extend(metric.collect())
+
+        return dataset
+
+    def _name(self, name: str, tags: Optional[Dict[str, str]]) -> bytes:
+        if not isinstance(name, str):
+            raise TypeError("name must be str, not {}".format(type(name).__name__))
+
+        return self._prefix + name.encode('ascii') + (encode_tags(tags) if tags else b'')
+
+    def _register(self, kind: type, name: bytes, *args):
+        metric = self._metrics.get(name)
+
+        if metric is None:
+            metric = self._metrics[name] = kind(name, *args)
+        elif type(metric) is not kind:
+            raise TypeError("{} is already registered as {}".format(name.decode('ascii'), type(metric).__name__))
+
+        return metric
@@ -0,0 +1,244 @@
+from argparse import ArgumentParser, ArgumentTypeError
+from asyncio import (AbstractServer, StreamReader, StreamWriter, new_event_loop, set_event_loop, start_server,
+                     start_unix_server)
+from logging import INFO, basicConfig, getLogger
+from os import path, remove
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Type, Union
+
+from .aggregation import (Aggregation, AvgAggregation, CountAggregation, MaxAggregation, MinAggregation,
+                          SumAggregation)
+from .graphite import Graphite
+from .protocols import GzipTcp, PickleTcp, PlainTcp
+from .spill import SpillStore
+
+__all__ = [
+    'Relay',
+]
+
+logger = getLogger(__package__)
+
+AGGREGATIONS = {
+    'avg': AvgAggregation,
+    'count': CountAggregation,
+    'max': MaxAggregation,
+    'min': MinAggregation,
+    'sum': SumAggregation,
+}
+PROTOCOLS = {
+    'gzip': GzipTcp,
+    'pickle': PickleTcp,
+    'plain': PlainTcp,
+}
+
+
+class Relay:
+    def __init__(self, graphite: Graphite, *, path: Optional[str] = None, host: Optional[str] = None,
+                 port: int = 2003, aggregations: Optional[Dict[Union[str, bytes], Type[Aggregation]]] = None,
+                 max_line: int = 4096, read_size: int = 65536):
+        if not path and not host:
+            raise ValueError("path or host must be set")
+
+        self._graphite = graphite
+        self._path = path
+        self._host = host
+        self._port = port
+        self._aggregations = tuple(
+            (suffix if isinstance(suffix, bytes) else suffix.encode('ascii'), aggregation)
+            for suffix, aggregation in (aggregations or {}).items()
+        )
+        self._suffixes = tuple(x for x, _ in self._aggregations)
+        self._max_line = max_line
+        self._read_size = read_size
+        self._servers = []  # type: List[AbstractServer]
+        self._writers = set()  # type: Set[StreamWriter]
+        self._received = 0
+        self._invalid = 0
+        self._reported_received = 0
+        self._reported_invalid = 0
+        graphite.add_stats(self._collect_stats)
+
+    @property
+    def received(self) -> int:
+        return self._received
+
+    @property
+    def invalid(self) -> int:
+        return self._invalid
+
+    async def start(self):
+        if self._path:
+            if path.exists(self._path):
+                remove(self._path)
+
+            self._servers.append(await start_unix_server(self._handle, self._path))
+            logger.info("Relaying metrics from %s", self._path)
+
+        if self._host:
+            self._servers.append(await start_server(self._handle, self._host, self._port))
+            logger.info("Relaying metrics from %s:%s", self._host, self._port)
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+
+        for writer in list(self._writers):
+            writer.close()
+
+        for server in self._servers:
+            await server.wait_closed()
+
+        self._servers = []
+
+        if self._path and path.exists(self._path):
+            remove(self._path)
+
+    async def _handle(self, reader: StreamReader, writer: StreamWriter):
+        self._writers.add(writer)
+        tail = b''
+        skipping = False
+
+        try:
+            while True:
+                data = await reader.read(self._read_size)
+
+                if not data:
+                    break
+
+                if skipping:
+                    end = data.find(b'\n')
+
+                    if end < 0:
+                        continue
+
+                    data = data[end + 1:]
+                    skipping = False
+
+                lines = (tail + data).split(b'\n')
+                tail = lines.pop()
+
+                if len(tail) > self._max_line:
+                    logger.warning("Dropping line over %s bytes", self._max_line)
+                    self._invalid += 1
+                    tail = b''
+                    skipping = True
+
+                self._relay(lines)
+
+            if tail:
+                self._relay([tail])
+        except Exception as exc:
+            logger.error("Dropping relay connection: %s", exc)
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _relay(self, lines: List[bytes]):
+        graphite = self._graphite
+        invalid = 0
+
+        for line in lines:
+            try:
+                metric, value, timestamp = line.split()
+                value = _parse_value(value)
+                timestamp = int(float(timestamp))
+            except (ValueError, OverflowError):
+                if line.strip():
+                    invalid += 1
+
+                continue
+
+            if self._suffixes and metric.endswith(self._suffixes):
+                graphite.aggregate(metric, value, self._aggregation(metric))
+            else:
+                graphite.send(metric, value, timestamp if timestamp > 0 else None)
+
+            self._received += 1
+
+        if invalid:
+            logger.warning("Dropping %s invalid lines", invalid)
+            self._invalid += invalid
+
+    def _aggregation(self, metric: bytes) -> Type[Aggregation]:
+        for suffix, aggregation in self._aggregations:
+            if metric.endswith(suffix):
+                return aggregation
+
+    def _collect_stats(self) -> Iterable[Tuple[bytes, int]]:
+        stats = (
+            (b'relay.received', self._received - self._reported_received),
+            (b'relay.invalid', self._invalid - self._reported_invalid),
+        )
+        self._reported_received = self._received
+        self._reported_invalid = self._invalid
+        return stats
+
+
+def _parse_value(value: bytes) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+
+    if not number.is_integer():
+        raise ValueError("Value {} is not an integer".format(value))
+
+    return int(number)
+
+
+def aggregation_rule(rule: str) -> Tuple[str, Type[Aggregation]]:
+    suffix, _, name = rule.rpartition('=')
+
+    if not suffix or name not in AGGREGATIONS:
+        raise ArgumentTypeError("expected SUFFIX=FUNC with FUNC one of {}, not {!r}".format(
+            ', '.join(sorted(AGGREGATIONS)), rule))
+
+    return suffix, AGGREGATIONS[name]
+
+
+def main(args):
+    basicConfig(level=INFO)
+    loop = new_event_loop()
+    set_event_loop(loop)
+    aggregations = dict(args.aggregate)
+    protocol_class = PROTOCOLS[args.protocol]
+
+    if args.upstream_port:
+        protocol = protocol_class(args.upstream_host, args.upstream_port)
+    else:
+        protocol = protocol_class(args.upstream_host)
+
+    graphite = Graphite(
+        protocol,
+        queue_size=args.queue_size,
+        flush_interval=args.flush_interval,
+        spill=SpillStore(args.spill) if args.spill else None,
+        stats_prefix=args.stats_prefix,
+    )
+    relay = Relay(graphite, path=args.path, host=args.host, port=args.port, aggregations=aggregations)
+    loop.run_until_complete(relay.start())
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(relay.close())
+        loop.run_until_complete(graphite.close())
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Accept plaintext metrics from local processes and forward them upstream")
+    parser.add_argument('--path', help="unix socket path to listen on")
+    parser.add_argument('--host', help="address to listen on")
+    parser.add_argument('--port', type=int, default=2003, help="port to listen on")
+    parser.add_argument('--upstream-host', default='127.0.0.1', help="carbon host")
+    parser.add_argument('--upstream-port', type=int, help="carbon port, protocol default if omitted")
+    parser.add_argument('--protocol', choices=sorted(PROTOCOLS), default='plain', help="upstream protocol")
+    parser.add_argument('--aggregate', action='append', default=[], type=aggregation_rule, metavar='SUFFIX=FUNC',
+                        help="aggregate series ending with SUFFIX per flush with one of {}".format(
+                            ', '.join(sorted(AGGREGATIONS))))
+    parser.add_argument('--flush-interval', type=float, default=1., help="seconds between batches")
+    parser.add_argument('--queue-size', type=int, default=1000000, help="points kept while upstream is down")
+    parser.add_argument('--spill', help="directory to spill points to while upstream is down")
+    parser.add_argument('--stats-prefix', help="prefix for the relay's own stats")
+    main(parser.parse_args())
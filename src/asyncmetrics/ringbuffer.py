@@ -0,0 +1,110 @@
+from array import array
+from typing import Dict, List, Optional, Tuple, Union
+
+__all__ = [
+    'RingBuffer',
+]
+
+
+class RingBuffer:
+    def __init__(self, size: int, *, keep_evicted: bool = False):
+        if size < 1:
+            raise ValueError("size must be positive, not {}".format(size))
+
+        self._size = size
+        self._ids = {}  # type: Dict[Union[str, bytes], int]
+        self._names = []  # type: List[Union[str, bytes]]
+        self._name_ids = array('I')
+        self._values = array('q')
+        self._timestamps = array('q')
+        self._head = 0
+        self._tail = 0
+        self.dropped = 0
+        self.evicted = [] if keep_evicted else None  # type: Optional[List[Tuple[Union[str, bytes], int, int]]]
+
+    def __len__(self) -> int:
+        return self._tail - self._head
+
+    def push(self, name: Union[str, bytes], value: int, timestamp: int):
+        index = self._tail % self._size
+        full = self._tail - self._head == self._size
+
+        if full and self.evicted is not None:
+            evicted = self._names[self._name_ids[index]], self._values[index], self._timestamps[index]
+        elif index == len(self._values):
+            self._name_ids.append(0)
+            self._values.append(0)
+            self._timestamps.append(0)
+
+        self._values[index] = value
+        self._timestamps[index] = timestamp
+        self._name_ids[index] = self._intern(name)
+        self._tail += 1
+
+        if full:
+            self._head += 1
+
+            if self.evicted is None:
+                self.dropped += 1
+            else:
+                self.evicted.append(evicted)
+
+    def pop(self, limit: Optional[int] = None) -> List[Tuple[Union[str, bytes], int, int]]:
+        count = len(self) if limit is None else min(limit, len(self))
+        start = self._head % self._size
+        stop = start + count
+
+        if stop <= self._size:
+            ranges = ((start, stop),)
+        else:
+            ranges = ((start, self._size), (0, stop - self._size))
+
+        names = self._names
+        dataset = []
+
+        for start, stop in ranges:
+            dataset.extend(zip(
+                (names[x] for x in self._name_ids[start:stop]),
+                self._values[start:stop],
+                self._timestamps[start:stop],
+            ))
+
+        self._head += count
+
+        if self._head == self._tail:
+            self._ids.clear()
+            del self._names[:]
+
+        return dataset
+
+    def _intern(self, name: Union[str, bytes]) -> int:
+        name_id = self._ids.get(name)
+
+        if name_id is None:
+            if len(self._names) >= 2 * self._size:
+                self._compact()
+
+            name_id = self._ids[name] = len(self._names)
+            self._names.append(name)
+
+        return name_id
+
+    def _compact(self):
+        names = self._names
+        name_ids = self._name_ids
+        ids = {}  # type: Dict[Union[str, bytes], int]
+        live = []  # type: List[Union[str, bytes]]
+
+        for position in range(self._head, self._tail):
+            index = position % self._size
+            name = names[name_ids[index]]
+            name_id = ids.get(name)
+
+            if name_id is None:
+                name_id = ids[name] = len(live)
+                live.append(name)
+
+            name_ids[index] = name_id
+
+        self._ids = ids
+        self._names = live
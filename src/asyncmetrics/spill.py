@@ -0,0 +1,152 @@
+from collections import deque
+from logging import getLogger
+from mmap import ACCESS_READ, mmap
+from os import listdir, makedirs, path, remove
+from struct import Struct, error as StructError
+from typing import Deque, Iterable, List, Optional, Tuple, Union
+
+__all__ = [
+    'SpillStore',
+]
+
+logger = getLogger(__package__)
+
+_header = Struct('<H')
+_point = Struct('<qq')
+
+
+class SpillStore:
+    _suffix = '.seg'
+
+    def __init__(self, directory: str, *, max_size: int = 268435456, segment_size: int = 4194304):
+        makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._max_size = max_size
+        self._segment_size = segment_size
+        self._segments = deque(sorted(
+            path.join(directory, x) for x in listdir(directory) if x.endswith(self._suffix)
+        ))  # type: Deque[str]
+        self._size = sum(path.getsize(x) for x in self._segments)
+        self._sequence = int(path.basename(self._segments[-1])[:-len(self._suffix)]) + 1 if self._segments else 0
+        self._file = None
+        self._file_size = 0
+        self._replay = deque()  # type: Deque[Tuple[bytes, int, int]]
+        self._replaying = None  # type: Optional[str]
+        self._unacked = []  # type: List[Tuple[bytes, int, int]]
+
+    def __bool__(self) -> bool:
+        return bool(self._size or self._replay or self._unacked)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def write(self, dataset: Iterable[Tuple[Union[str, bytes], int, int]]) -> int:
+        records = []
+        invalid = 0
+
+        for metric, value, timestamp in dataset:
+            if not isinstance(metric, bytes):
+                metric = metric.encode('ascii')
+
+            try:
+                records.append(_header.pack(len(metric)) + metric + _point.pack(value, timestamp))
+            except StructError:
+                invalid += 1
+
+        if invalid:
+            logger.error("Dropping %s metrics not fitting spill records", invalid)
+
+        if not records:
+            return invalid
+
+        data = b''.join(records)
+
+        if not self._file or self._file_size >= self._segment_size:
+            self._roll()
+
+        self._file.write(data)
+        self._file.flush()
+        self._file_size += len(data)
+        self._size += len(data)
+        self._evict()
+        return invalid
+
+    def read(self, limit: int) -> List[Tuple[bytes, int, int]]:
+        if not self._replay and not self._replaying and self._segments:
+            if self._file and self._segments[0] == self._file.name:
+                self._seal()
+
+            self._load(self._segments.popleft())
+
+        dataset = [self._replay.popleft() for _ in range(min(limit, len(self._replay)))]
+        self._unacked.extend(dataset)
+        return dataset
+
+    def commit(self):
+        self._unacked = []
+
+        if not self._replay and self._replaying:
+            self._size -= path.getsize(self._replaying)
+            remove(self._replaying)
+            self._replaying = None
+
+    def rollback(self):
+        self._replay.extendleft(reversed(self._unacked))
+        self._unacked = []
+
+    def close(self):
+        if self._replaying:
+            self.rollback()
+            name, self._replaying = self._replaying, None
+            self.write(self._replay)
+            self._replay.clear()
+            self._size -= path.getsize(name)
+            remove(name)
+
+        self._seal()
+
+    def _roll(self):
+        self._seal()
+        name = path.join(self._directory, '{:020d}{}'.format(self._sequence, self._suffix))
+        self._sequence += 1
+        self._file = open(name, 'ab')
+        self._file_size = 0
+        self._segments.append(name)
+
+    def _seal(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _evict(self):
+        while self._size > self._max_size and len(self._segments) > 1:
+            name = self._segments.popleft()
+            self._size -= path.getsize(name)
+            remove(name)
+            logger.warning("Evicted spill segment %s over the limit", name)
+
+    def _load(self, name: str):
+        size = path.getsize(name)
+        points = []
+
+        if size:
+            with open(name, 'rb') as f, mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+                offset = 0
+
+                while offset + _header.size <= size:
+                    length, = _header.unpack_from(data, offset)
+                    start = offset + _header.size
+                    end = start + length
+
+                    if end + _point.size > size:
+                        logger.warning("Truncated spill segment %s at %s", name, offset)
+                        break
+
+                    value, timestamp = _point.unpack_from(data, end)
+                    points.append((data[start:end], value, timestamp))
+                    offset = end + _point.size
+
+        points.sort(key=lambda x: x[2])
+        self._replay.extend(points)
+        self._replaying = name
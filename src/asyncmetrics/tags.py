@@ -0,0 +1,50 @@
+from typing import Dict, Tuple, Union
+
+__all__ = [
+    'encode_tags',
+    'insert_suffix',
+]
+
+_cache = {}  # type: Dict[Tuple[Tuple[str, str], ...], bytes]
+_cache_size = 10000
+_invalid_name = frozenset(';!^=')
+
+
+def encode_tags(tags: Dict[str, str]) -> bytes:
+    key = tuple(tags.items())
+    encoded = _cache.get(key)
+
+    if encoded is None:
+        if len(_cache) >= _cache_size:
+            _cache.clear()
+
+        encoded = _cache[key] = _encode(tags)
+
+    return encoded
+
+
+def insert_suffix(metric: Union[str, bytes], suffix: bytes) -> Union[str, bytes]:
+    if not suffix:
+        return metric
+
+    if isinstance(metric, bytes):
+        path, separator, tags = metric.partition(b';')
+        return path + suffix + separator + tags
+
+    path, separator, tags = metric.partition(';')
+    return path + suffix.decode('ascii') + separator + tags
+
+
+def _encode(tags: Dict[str, str]) -> bytes:
+    parts = []
+
+    for name, value in sorted((str(k), str(v)) for k, v in tags.items()):
+        if not name or _invalid_name.intersection(name):
+            raise ValueError("Invalid tag name {!r}".format(name))
+
+        if not value or ';' in value or value.startswith('~'):
+            raise ValueError("Invalid tag value {!r} for {}".format(value, name))
+
+        parts.append(';{}={}'.format(name, value))
+
+    return ''.join(parts).encode('ascii')
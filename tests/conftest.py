@@ -0,0 +1,29 @@
+from asyncio import sleep
+from typing import List
+
+from asyncmetrics import PlainTcp, ProtocolError
+
+
+class SomeError(Exception):
+    pass
+
+
+class ProtocolMock(PlainTcp):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent = []
+        self.batches = 0
+
+    async def connect(self):
+        pass
+
+    async def send(self, dataset: List[tuple]):
+        if any(n == 'test_send_failed' for n, _, _ in dataset):
+            raise ProtocolError
+        elif any(n == 'test_some_error' for n, _, _ in dataset):
+            raise SomeError
+        elif any(n == 'test_flush' for n, _, _ in dataset):
+            await sleep(.001)
+
+        self.sent.extend(dataset)
+        self.batches += 1
@@ -0,0 +1,129 @@
+from pytest import mark
+
+from asyncmetrics.aggregation import (AvgAggregation, CountAggregation, HistogramAggregation, MaxAggregation,
+                                      MinAggregation, SumAggregation)
+
+
+@mark.parametrize('aggregation,values,value', [
+    (MaxAggregation, [3, 7, 5], 7),
+    (MinAggregation, [3, 7, 5], 3),
+    (SumAggregation, [3, 7, 5], 15),
+    (CountAggregation, [3, 7, 5], 15),
+    (AvgAggregation, [3, 7, 5], 5),
+    (AvgAggregation, [1, 2], 2),
+    (MaxAggregation, [4], 4),
+])
+def test_aggregation(aggregation, values, value):
+    first, *rest = values
+    instance = aggregation(first)
+
+    for x in rest:
+        instance.add(x)
+
+    assert instance.value == value
+
+
+@mark.parametrize('aggregation,value', [
+    (MaxAggregation, 7),
+    (MinAggregation, 3),
+    (SumAggregation, 3 * 2 + 7 * 10 + 5 * 2),
+    (CountAggregation, 3 * 2 + 7 * 10 + 5 * 2),
+    (AvgAggregation, 6),
+])
+def test_weighted_aggregation(aggregation, value):
+    instance = aggregation(3, 2)
+    instance.add(7, 10)
+    instance.add(5, 2)
+    assert instance.value == value
+
+
+def test_weighted_histogram():
+    instance = HistogramAggregation(1, 10)
+    instance.add(100, 90)
+    items = dict(instance.items())
+    assert items[b'.count'] == 100
+    assert items[b'.p50'] == 100
+
+
+@mark.parametrize('aggregation,first,second,value', [
+    (MaxAggregation, [3, 7], [9, 1], 9),
+    (MinAggregation, [3, 7], [9, 1], 1),
+    (SumAggregation, [3, 7], [9, 1], 20),
+    (CountAggregation, [3, 7], [9, 1, 1], 21),
+    (AvgAggregation, [3, 7], [9, 1, 5], 5),
+])
+def test_merge(aggregation, first, second, value):
+    instances = []
+
+    for values in first, second:
+        instance = aggregation(values[0])
+
+        for x in values[1:]:
+            instance.add(x)
+
+        instances.append(aggregation.from_state(instance.state))
+
+    instances[0].merge(instances[1])
+    assert instances[0].value == value
+
+
+def test_merge_histogram():
+    first = HistogramAggregation(1)
+    second = HistogramAggregation(1000)
+
+    for x in range(2, 501):
+        first.add(x)
+
+    for x in range(501, 1000):
+        second.add(x)
+
+    reference = HistogramAggregation(1)
+
+    for x in range(2, 1001):
+        reference.add(x)
+
+    first.merge(HistogramAggregation.from_state(second.state))
+    assert list(first.items()) == list(reference.items())
+
+
+def test_items():
+    assert list(MaxAggregation(4).items()) == [(b'', 4)]
+
+
+def test_histogram():
+    instance = HistogramAggregation(1)
+
+    for x in range(2, 1001):
+        instance.add(x)
+
+    items = dict(instance.items())
+    assert list(items) == [b'.p50', b'.p90', b'.p99', b'.max', b'.count']
+    assert items[b'.max'] == 1000
+    assert items[b'.count'] == 1000
+
+    for suffix, expected in (b'.p50', 500), (b'.p90', 900), (b'.p99', 990):
+        assert expected <= items[suffix] <= expected * (1 + 2 ** (1 - HistogramAggregation.precision))
+
+
+@mark.parametrize('values,items', [
+    ([5], [(b'.p50', 5), (b'.p90', 5), (b'.p99', 5), (b'.max', 5), (b'.count', 1)]),
+    ([-3, 0], [(b'.p50', 0), (b'.p90', 0), (b'.p99', 0), (b'.max', 0), (b'.count', 2)]),
+    ([10 ** 12, 1], [(b'.p50', 1), (b'.p90', 10 ** 12), (b'.p99', 10 ** 12), (b'.max', 10 ** 12), (b'.count', 2)]),
+])
+def test_histogram_items(values, items):
+    first, *rest = values
+    instance = HistogramAggregation(first)
+
+    for x in rest:
+        instance.add(x)
+
+    assert list(instance.items()) == items
+
+
+def test_histogram_buckets():
+    instance = HistogramAggregation(0)
+
+    for x in range(1000000):
+        instance.add(x)
+
+    assert len(instance._counts) < 1000
@@ -0,0 +1,51 @@
+from asyncmetrics.cardinality import CardinalityGuard
+
+
+def test_max_series():
+    guard = CardinalityGuard(2)
+    assert guard.admit('one') == 'one'
+    assert guard.admit(b'two') == b'two'
+    assert guard.admit('three') is None
+    assert guard.admit('one') == 'one'
+    assert len(guard) == 2
+    assert guard.rejected == 1
+
+
+def test_str_and_bytes():
+    guard = CardinalityGuard(1)
+    assert guard.admit('one') == 'one'
+    assert guard.admit(b'one') == b'one'
+    assert len(guard) == 1
+    assert guard.rejected == 0
+
+
+def test_prefixes():
+    guard = CardinalityGuard(prefixes={'api.': 2, 'api.users.': 1})
+
+    for name in 'api.a', b'api.b', 'api.c', 'api.users.1', b'api.users.2', 'other.1', 'other.2':
+        guard.admit(name)
+
+    assert len(guard) == 3
+    assert guard.rejected == 2
+    assert guard.admit('api.c') is None
+    assert guard.admit('api.a') == 'api.a'
+    assert guard.admit('other.3') == 'other.3'
+
+
+def test_prefixes_only_untracked():
+    guard = CardinalityGuard(prefixes={'api.': 1})
+
+    for x in range(1000):
+        assert guard.admit('other.{}'.format(x)) == 'other.{}'.format(x)
+
+    assert len(guard) == 0
+    assert guard.rejected == 0
+
+
+def test_overflow():
+    guard = CardinalityGuard(1, overflow='overflow')
+    assert guard.admit('one') == 'one'
+    assert guard.admit('two') == 'overflow'
+    assert guard.admit(b'three') == b'overflow'
+    assert len(guard) == 1
+    assert guard.rejected == 2
@@ -0,0 +1,44 @@
+from time import sleep
+
+from asyncmetrics.circuitbreaker import CircuitBreaker
+
+
+def test_closed():
+    breaker = CircuitBreaker()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.retry_in == 0
+
+
+def test_backoff():
+    breaker = CircuitBreaker(min_delay=1., max_delay=10., jitter=0.)
+    delays = []
+
+    for _ in range(6):
+        breaker.fail()
+        delays.append(breaker.delay)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.failures == 6
+    assert delays == [1., 2., 4., 8., 10., 10.]
+    assert 9 < breaker.retry_in <= 10
+
+
+def test_jitter():
+    breaker = CircuitBreaker(min_delay=1., max_delay=10., jitter=.5)
+
+    for failures in range(1, 100):
+        breaker.fail()
+        delay = min(10., 2. ** (failures - 1))
+        assert delay / 2 <= breaker.delay <= delay
+
+
+def test_half_open():
+    breaker = CircuitBreaker(min_delay=.001, jitter=0.)
+    breaker.fail()
+    sleep(.001)
+    assert breaker.retry_in == 0
+    breaker.half_open()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.succeed()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
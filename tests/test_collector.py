@@ -0,0 +1,54 @@
+from asyncio import sleep
+
+from pytest import mark
+
+from asyncmetrics import Graphite, PartialUnix
+from asyncmetrics.aggregation import CountAggregation, HistogramAggregation, MaxAggregation
+from asyncmetrics.collector import Collector
+from conftest import ProtocolMock
+
+
+@mark.asyncio
+async def test_collector(tmp_path):
+    path = str(tmp_path / 'collector.sock')
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=.05)
+    collector = Collector(graphite, path)
+    await collector.start()
+    workers = [Graphite(protocol=PartialUnix(path), flush_interval=.01) for _ in range(4)]
+
+    for number, worker in enumerate(workers):
+        worker.send('test_collector.point', number, 1)
+
+        for x in range(100):
+            worker.aggregate(b'test_collector.count', 1, CountAggregation)
+            worker.aggregate(b'test_collector.max', number * 100 + x, MaxAggregation)
+            worker.aggregate(b'test_collector.latency', number * 100 + x, HistogramAggregation)
+
+    await sleep(.03)
+
+    for worker in workers:
+        await worker.close()
+
+    await sleep(.1)
+    await collector.close()
+    await graphite.close()
+    sent = {(n, v) for n, v, _ in protocol.sent}
+    assert {(b'test_collector.point', x) for x in range(4)} < sent
+    assert (b'test_collector.count', 400) in sent
+    assert (b'test_collector.max', 399) in sent
+    assert (b'test_collector.latency.count', 400) in sent
+    assert (b'test_collector.latency.max', 399) in sent
+    assert len(protocol.sent) == 4 + 2 + 5
+    assert collector.received == 4 + 4 * 3
+    assert not (tmp_path / 'collector.sock').exists()
+
+
+@mark.asyncio
+async def test_collector_unavailable(tmp_path):
+    worker = Graphite(protocol=PartialUnix(str(tmp_path / 'missing.sock')), flush_interval=.01)
+    worker.aggregate('test_collector_unavailable', 1, CountAggregation)
+    await sleep(.03)
+    worker.aggregate('test_collector_unavailable', 1, CountAggregation)
+    await worker.close()
+    assert worker._aggregations['test_collector_unavailable'].value == 2
@@ -1,29 +1,18 @@
-from asyncio import sleep
+from asyncio import gather, get_event_loop, new_event_loop, sleep
+from concurrent.futures import ThreadPoolExecutor
+from os import listdir
+from socket import AF_INET, SOCK_DGRAM, socket
+from threading import Thread
 from typing import List
+from unittest.mock import ANY
+from warnings import catch_warnings, simplefilter
 
 from pytest import mark, raises
 
-from asyncmetrics import Graphite, PlainTcp, ProtocolError
-
-
-class SomeError(Exception):
-    pass
-
-
-class ProtocolMock(PlainTcp):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.sent = []
-
-    async def send(self, dataset: List[tuple]):
-        if any(n == 'test_send_failed' for n, _, _ in dataset):
-            raise ProtocolError
-        elif any(n == 'test_some_error' for n, _, _ in dataset):
-            raise SomeError
-        elif any(n == 'test_flush' for n, _, _ in dataset):
-            await sleep(.001)
-
-        self.sent.extend(dataset)
+from asyncmetrics import CountMetric, Graphite, NullGraphite, PlainUdp, ProtocolError, Registry, SpillStore
+from asyncmetrics.aggregation import CountAggregation, HistogramAggregation, MaxAggregation
+from asyncmetrics.circuitbreaker import CircuitBreaker
+from conftest import ProtocolMock, SomeError
 
 
 @mark.asyncio
@@ -80,7 +69,33 @@ async def test_send_failed():
     await sleep(.001)
     await graphite.close()
     assert not protocol.sent
-    assert graphite._queue.get_nowait()[0] == 'test_send_failed'
+    assert graphite._buffer.pop()[0][0] == 'test_send_failed'
+
+
+@mark.asyncio
+async def test_close_failed(caplog):
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=60)
+    graphite.send('test_close_failed', 1)
+    await sleep(.001)
+    graphite.send('test_send_failed', 2)
+    await graphite.close()
+    assert graphite._reconnect_task is None
+    assert [(n, v) for n, v, _ in protocol.sent] == []
+    assert "Dropping 2 unsent metrics on close" in caplog.text
+
+
+@mark.asyncio
+async def test_close_circuit_open(caplog):
+    protocol = FlakyProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=.001, fail_wait_min=60, fail_wait=60)
+    graphite.send('test_close_circuit_open', 1)
+    await sleep(.01)
+    reconnect_task = graphite._reconnect_task
+    await graphite.close()
+    assert reconnect_task.cancelled()
+    assert graphite._reconnect_task is reconnect_task
+    assert "Dropping 1 unsent metrics on close" in caplog.text
 
 
 @mark.asyncio
@@ -102,7 +117,536 @@ async def test_flush():
     graphite.send('test_flush', 1)
     await sleep(.001)
     assert not protocol.sent
-    assert graphite._queue.empty()
+    assert not graphite._buffer
     graphite.send('test_flush.no_sleep', 1)
     await graphite.close()
     assert len(protocol.sent) == 2
+
+
+@mark.asyncio
+async def test_aggregate():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=.01)
+
+    for value in range(1000):
+        graphite.aggregate('test_aggregate.max', value, MaxAggregation)
+        graphite.aggregate('test_aggregate.count', 1, CountAggregation)
+
+    await sleep(.02)
+    assert sorted((n, v) for n, v, _ in protocol.sent) == [('test_aggregate.count', 1000), ('test_aggregate.max', 999)]
+    graphite.aggregate('test_aggregate.max', 1, MaxAggregation)
+    await graphite.close()
+    assert [(n, v) for n, v, _ in protocol.sent[2:]] == [('test_aggregate.max', 1)]
+
+
+@mark.asyncio
+async def test_aggregate_count_values():
+    protocol = ProtocolMock()
+
+    async with Graphite(protocol=protocol, flush_interval=.01) as graphite:
+        metric = CountMetric('test_aggregate_count_values', graphite=graphite)
+        metric.send(10)
+        metric.send(5)
+        await sleep(.02)
+
+    assert [(n, v) for n, v, _ in protocol.sent] == [(b'test_aggregate_count_values.count', 15)]
+
+
+@mark.asyncio
+async def test_aggregate_weight():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=.01)
+
+    for _ in range(100):
+        graphite.aggregate('test_aggregate_weight.count', 1, CountAggregation, 10)
+
+    await sleep(.02)
+    await graphite.close()
+    assert [(n, v) for n, v, _ in protocol.sent] == [('test_aggregate_weight.count', 1000)]
+
+
+@mark.asyncio
+async def test_aggregate_histogram():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=.01)
+
+    for value in range(100):
+        graphite.aggregate('test_aggregate_histogram', value, HistogramAggregation)
+        graphite.aggregate(b'test_aggregate_histogram.bytes', value, HistogramAggregation)
+
+    await sleep(.02)
+    await graphite.close()
+    sent = {n: v for n, v, _ in protocol.sent}
+    assert sent['test_aggregate_histogram.p99'] == 98
+    assert sent['test_aggregate_histogram.max'] == 99
+    assert sent[b'test_aggregate_histogram.bytes.count'] == 100
+    assert len(sent) == 10
+
+
+@mark.asyncio
+async def test_aggregate_invalid():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol)
+    # noinspection PyTypeChecker
+    graphite.aggregate('test_aggregate_invalid', 'one', MaxAggregation)
+    await graphite.close()
+    graphite.aggregate('test_aggregate_invalid', 1, MaxAggregation)
+    assert not protocol.sent
+
+
+@mark.asyncio
+async def test_max_batch_points():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=0, max_batch_points=3)
+
+    for value in range(10):
+        graphite.send('test_max_batch_points', value)
+
+    await sleep(.001)
+    await graphite.close()
+    assert [v for _, v, _ in protocol.sent] == list(range(10))
+    assert protocol.batches == 4
+
+
+@mark.asyncio
+async def test_max_batch_points_failed():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=0, max_batch_points=2)
+
+    for value in range(2):
+        graphite.send('test_max_batch_points_failed', value)
+
+    graphite.send('test_send_failed', 2)
+    graphite.send('test_max_batch_points_failed', 3)
+    await sleep(.001)
+    await graphite.close()
+    assert [v for _, v, _ in protocol.sent] == [0, 1]
+    assert graphite._buffer.pop() == [('test_send_failed', 2, ANY), ('test_max_batch_points_failed', 3, ANY)]
+
+
+class FlakyProtocolMock(ProtocolMock):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failing = True
+
+    async def connect(self):
+        if self.failing:
+            raise ProtocolError
+
+    async def send(self, dataset: List[tuple]):
+        if self.failing:
+            raise ProtocolError
+        await super().send(dataset)
+
+
+@mark.asyncio
+async def test_spill(tmp_path):
+    protocol = FlakyProtocolMock()
+    spill = SpillStore(str(tmp_path))
+    graphite = Graphite(protocol=protocol, flush_interval=0, fail_wait=0, spill=spill, spill_rate=1000000)
+    graphite.send('test_spill', 1, 1)
+    graphite.send('test_spill', 2, 2)
+    await sleep(.001)
+    assert not protocol.sent
+    protocol.failing = False
+    graphite.send('test_spill', 3, 3)
+    await sleep(.01)
+    await graphite.close()
+    assert not spill and not graphite._buffer
+    assert sorted((bytes(n, 'ascii') if isinstance(n, str) else n, v, t) for n, v, t in protocol.sent) == [
+        (b'test_spill', 1, 1),
+        (b'test_spill', 2, 2),
+        (b'test_spill', 3, 3),
+    ]
+
+
+@mark.asyncio
+async def test_spill_on_close(tmp_path):
+    protocol = FlakyProtocolMock()
+    graphite = Graphite(protocol=protocol, spill=SpillStore(str(tmp_path)))
+    graphite.send('test_spill_on_close', 1, 1)
+    await graphite.close()
+    assert SpillStore(str(tmp_path)).read(10) == [(b'test_spill_on_close', 1, 1)]
+
+
+@mark.asyncio
+async def test_spill_overflow(tmp_path):
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, queue_size=2, spill=SpillStore(str(tmp_path)))
+
+    for value in range(5):
+        graphite.send('test_spill_overflow', value, value)
+
+    await graphite.close()
+    assert graphite._dropped == 0
+    assert sorted(v for _, v, _ in protocol.sent + SpillStore(str(tmp_path)).read(10)) == list(range(5))
+
+
+@mark.asyncio
+async def test_spill_invalid_name(tmp_path):
+    protocol = FlakyProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=0, spill=SpillStore(str(tmp_path)))
+    graphite.send('a' * 65536, 1, 1)
+    graphite.send('test_spill_invalid_name', 2, 2)
+    await sleep(.01)
+    assert not graphite._sender_task.done()
+    assert graphite._dropped == 1
+    await graphite.close()
+    assert SpillStore(str(tmp_path)).read(10) == [(b'test_spill_invalid_name', 2, 2)]
+
+
+@mark.asyncio
+async def test_spill_replay_failed(tmp_path):
+    protocol = FlakyProtocolMock()
+    spill = SpillStore(str(tmp_path))
+    spill.write([('test_spill_replay_failed', 1, 1)])
+    graphite = Graphite(protocol=protocol, flush_interval=60, spill=spill)
+    await graphite._flush(0.)
+    assert not protocol.sent
+    assert len(listdir(str(tmp_path))) == 1
+    assert spill.read(10) == [(b'test_spill_replay_failed', 1, 1)]
+    spill.rollback()
+    await graphite.close()
+    assert SpillStore(str(tmp_path)).read(10) == [(b'test_spill_replay_failed', 1, 1)]
+
+
+@mark.asyncio
+async def test_circuit_breaker():
+    protocol = FlakyProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=0, fail_wait=.01, fail_wait_min=.001, probe_size=2)
+
+    for value in range(5):
+        graphite.send('test_circuit_breaker', value)
+
+    await sleep(.005)
+    assert graphite._breaker.state == CircuitBreaker.OPEN
+    assert graphite._breaker.failures > 1
+    assert len(graphite._buffer) == 5
+    protocol.failing = False
+    await sleep(.05)
+    assert graphite._breaker.state == CircuitBreaker.CLOSED
+    assert sorted(v for _, v, _ in protocol.sent) == list(range(5))
+    assert protocol.batches == 2
+    await graphite.close()
+
+
+@mark.asyncio
+async def test_stats():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=60, queue_size=20, stats_prefix='asyncmetrics')
+
+    for value in range(30):
+        graphite.send('test_stats', value)
+
+    await graphite._flush(0.)
+
+    for value in range(2):
+        graphite.send('test_stats', value)
+
+    await graphite._flush(0.)
+    await graphite.close()
+    stats = {}
+
+    for name, value, _ in protocol.sent:
+        if name != 'test_stats':
+            stats.setdefault(name, []).append(value)
+
+    assert sorted(stats) == [
+        b'asyncmetrics.bytes',
+        b'asyncmetrics.dropped',
+        b'asyncmetrics.encode.sum.time.us',
+        b'asyncmetrics.lag.time.us',
+        b'asyncmetrics.queue_size',
+        b'asyncmetrics.reconnects',
+        b'asyncmetrics.send.max.time.us',
+        b'asyncmetrics.send.sum.time.us',
+        b'asyncmetrics.sent',
+        b'asyncmetrics.timeouts',
+    ]
+    assert stats[b'asyncmetrics.queue_size'][:2] == [20, 2]
+    assert stats[b'asyncmetrics.dropped'][:2] == [10, 0]
+    assert stats[b'asyncmetrics.sent'][1:] == [20, 2]
+    assert [v for n, v, _ in protocol.sent if n == 'test_stats'] == list(range(10, 30)) + [0, 1]
+
+
+@mark.asyncio
+async def test_stats_idle():
+    protocol = ProtocolMock()
+
+    async with Graphite(protocol=protocol, flush_interval=.005, stats_prefix='asyncmetrics'):
+        await sleep(.05)
+
+    assert len([n for n, _, _ in protocol.sent if n == b'asyncmetrics.sent']) > 2
+
+
+@mark.asyncio
+async def test_stats_datagrams():
+    def receive() -> List[bytes]:
+        datagrams = []
+
+        try:
+            while True:
+                datagrams.append(server.recv(65536))
+        except BlockingIOError:
+            return datagrams
+
+    def reported(datagrams: List[bytes]) -> List[int]:
+        lines = b''.join(datagrams).splitlines()
+        return [int(x.split()[1]) for x in lines if x.startswith(b'asyncmetrics.datagrams ')]
+
+    with socket(AF_INET, SOCK_DGRAM) as server:
+        server.bind(('127.0.0.1', 0))
+        server.setblocking(False)
+        graphite = Graphite(protocol=PlainUdp(*server.getsockname()), flush_interval=60, max_batch_points=1,
+                            stats_prefix='asyncmetrics')
+
+        for value in range(3):
+            graphite.send('test_stats_datagrams', value, 1)
+
+        await graphite._flush(0.)
+        first = receive()
+        await graphite._flush(0.)
+        second = receive()
+        await graphite.close()
+
+    assert reported(first) == [0]
+    assert reported(second) == [len(first)]
+    assert len(first) >= 3
+
+
+@mark.asyncio
+async def test_thread_safe():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=60, thread_safe=True)
+
+    def work(thread: int):
+        for x in range(1000):
+            graphite.send('test_thread_safe.{}'.format(thread), x, 1)
+            graphite.aggregate('test_thread_safe.count', 1, CountAggregation)
+
+    with ThreadPoolExecutor(4) as executor:
+        await gather(*(get_event_loop().run_in_executor(executor, work, x) for x in range(4)))
+
+    graphite.send('test_thread_safe.loop', 1, 1)
+    await sleep(.05)
+    await graphite.close()
+    assert len(graphite._local_buffers) == 0
+    assert sorted(v for n, v, _ in protocol.sent if n == 'test_thread_safe.2') == list(range(1000))
+    assert [v for n, v, _ in protocol.sent if n == 'test_thread_safe.count'] == [4000]
+    assert [v for n, v, _ in protocol.sent if n == 'test_thread_safe.loop'] == [1]
+    assert len(protocol.sent) == 4002
+
+
+@mark.asyncio
+async def test_thread_safe_wakeup():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=0, thread_safe=True)
+    await sleep(.01)
+    thread = Thread(target=graphite.send, args=('test_thread_safe_wakeup', 1, 1))
+    thread.start()
+    thread.join()
+    await sleep(.01)
+    assert [(n, v) for n, v, _ in protocol.sent] == [('test_thread_safe_wakeup', 1)]
+    await graphite.close()
+
+
+def test_lazy_start():
+    graphite = Graphite()
+    assert graphite._sender_task is None
+
+    with catch_warnings():
+        simplefilter('error')
+        graphite.send('test_lazy_start', 1)
+
+    assert graphite._sender_task is None
+    assert graphite._loop is None
+    assert graphite._pending is None
+    assert len(graphite._buffer) == 1
+    assert graphite._protocol is not Graphite()._protocol
+
+
+@mark.asyncio
+async def test_start_on_send():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=0)
+    assert graphite._sender_task is None
+    graphite.send('test_start_on_send', 1)
+    assert graphite._sender_task is not None
+    assert graphite._pending is not None
+    await sleep(.01)
+    assert len(protocol.sent) == 1
+    await graphite.close()
+
+
+@mark.asyncio
+async def test_close_not_started():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol)
+    graphite._buffer.push('test_close_not_started', 1, 1)
+    graphite._aggregations['test_close_not_started.count'] = CountAggregation(1)
+    await graphite.close()
+    assert graphite._sender_task is None
+    assert sorted(n for n, _, _ in protocol.sent) == ['test_close_not_started', 'test_close_not_started.count']
+
+
+@mark.asyncio
+async def test_context_manager():
+    protocol = ProtocolMock()
+
+    async with Graphite(protocol=protocol, flush_interval=.01) as graphite:
+        assert graphite._sender_task is not None
+        graphite.send('test_context_manager', 1)
+        await sleep(.001)
+
+    assert [n for n, _, _ in protocol.sent] == ['test_context_manager']
+    assert not graphite._running
+
+
+@mark.asyncio
+async def test_context_manager_no_await():
+    protocol = ProtocolMock()
+
+    async with Graphite(protocol=protocol, flush_interval=.01) as graphite:
+        graphite.send('test_context_manager_no_await', 1)
+        graphite.aggregate('test_context_manager_no_await.count', 1, CountAggregation)
+
+    assert sorted(n for n, _, _ in protocol.sent) == [
+        'test_context_manager_no_await',
+        'test_context_manager_no_await.count',
+    ]
+
+
+@mark.asyncio
+async def test_close_not_run():
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol)
+    graphite.send('test_close_not_run', 1)
+    assert graphite._sender_task is not None
+    await graphite.close()
+    assert graphite._sender_task.cancelled()
+    assert [n for n, _, _ in protocol.sent] == ['test_close_not_run']
+    assert not graphite._buffer
+
+
+@mark.asyncio
+async def test_null_graphite():
+    async with NullGraphite() as graphite:
+        graphite.send('test_null_graphite', 1)
+        graphite.aggregate('test_null_graphite', 1, CountAggregation)
+        graphite.merge('test_null_graphite', CountAggregation(1))
+        assert graphite._sender_task is None
+        assert not graphite._buffer
+        assert not graphite._aggregations
+
+
+@mark.asyncio
+async def test_send_tags():
+    protocol = ProtocolMock()
+
+    async with Graphite(protocol=protocol, flush_interval=.01) as graphite:
+        graphite.send('test_send_tags', 1, 1, tags={'region': 'eu', 'dc': 'ams1'})
+        graphite.send(b'test_send_tags', 2, 1, tags={'dc': 'ams1', 'region': 'eu'})
+        graphite.send('test_send_tags', 3, 1, tags={'dc': ';'})
+        graphite.aggregate('test_send_tags.latency', 5, HistogramAggregation, tags={'dc': 'ams1'})
+        graphite.aggregate(b'test_send_tags.count', 1, CountAggregation, tags={'dc': 'ams1'})
+        graphite.aggregate('test_send_tags.count', 1, CountAggregation, tags={'dc': 'ams1'})
+        await sleep(.02)
+
+    sent = sorted((n, v) for n, v, _ in protocol.sent)
+    assert sent == [
+        (b'test_send_tags.count;dc=ams1', 2),
+        (b'test_send_tags.latency.count;dc=ams1', 1),
+        (b'test_send_tags.latency.max;dc=ams1', 5),
+        (b'test_send_tags.latency.p50;dc=ams1', 5),
+        (b'test_send_tags.latency.p90;dc=ams1', 5),
+        (b'test_send_tags.latency.p99;dc=ams1', 5),
+        (b'test_send_tags;dc=ams1;region=eu', 1),
+        (b'test_send_tags;dc=ams1;region=eu', 2),
+    ]
+
+
+@mark.asyncio
+async def test_max_series():
+    protocol = ProtocolMock()
+
+    async with Graphite(protocol=protocol, flush_interval=.01, max_series=3, max_series_per_prefix={'user.': 1},
+                        stats_prefix='asyncmetrics') as graphite:
+        for user in range(10):
+            graphite.send('user.{}'.format(user), 1, 1)
+            graphite.aggregate('api.{}.count'.format(user), 1, CountAggregation)
+
+        graphite.send('user.0', 2, 1)
+        await sleep(.02)
+
+    sent = [(n, v) for n, v, _ in protocol.sent if not isinstance(n, bytes)]
+    stats = {}
+
+    for name, value, _ in protocol.sent:
+        if isinstance(name, bytes):
+            stats.setdefault(name, []).append(value)
+
+    assert sorted(sent) == [('api.0.count', 1), ('api.1.count', 1), ('user.0', 1), ('user.0', 2)]
+    assert set(stats[b'asyncmetrics.series']) == {3}
+    assert sum(stats[b'asyncmetrics.series.rejected']) == 9 + 8
+
+
+@mark.asyncio
+async def test_overflow_series():
+    protocol = ProtocolMock()
+
+    async with Graphite(protocol=protocol, flush_interval=.01, max_series=1, overflow_series='overflow') as graphite:
+        for user in range(10):
+            graphite.aggregate('api.{}.count'.format(user), 1, CountAggregation)
+
+        graphite.merge('api.merged.max', MaxAggregation(7))
+        graphite.aggregate('api.aggregated.max', 7, MaxAggregation)
+        await sleep(.02)
+
+    assert sorted((n, v) for n, v, _ in protocol.sent) == [('api.0.count', 1), ('overflow', 9)]
+
+
+@mark.asyncio
+async def test_registry():
+    protocol = ProtocolMock()
+    registry = Registry()
+    counter = registry.counter('test_registry.requests')
+    registry.callback('test_registry.pool', lambda: 3)
+    graphite = Graphite(protocol=protocol, flush_interval=.01, registry=registry)
+    assert graphite._sender_task is not None
+
+    for _ in range(1000):
+        counter.value += 1
+
+    await sleep(.015)
+    await graphite.close()
+    sent = {}
+
+    for name, value, _ in protocol.sent:
+        sent.setdefault(name, []).append(value)
+
+    assert sum(sent[b'test_registry.requests']) == 1000
+    assert set(sent[b'test_registry.pool']) == {3}
+    assert len(sent[b'test_registry.pool']) >= 2
+
+
+def test_registry_started_in_loop():
+    protocol = ProtocolMock()
+    registry = Registry()
+    counter = registry.counter('test_registry_started_in_loop')
+    graphite = Graphite(protocol=protocol, flush_interval=.01, registry=registry)
+    assert graphite._sender_task is None
+
+    async def main():
+        async with graphite:
+            counter.inc()
+            await sleep(.02)
+            counter.inc(2)
+
+    loop = new_event_loop()
+
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+    assert sum(v for n, v, _ in protocol.sent if n == b'test_registry_started_in_loop') == 3
@@ -0,0 +1,39 @@
+from threading import Thread
+
+from pytest import raises
+
+from asyncmetrics.aggregation import MaxAggregation
+from asyncmetrics.localbuffer import LocalBuffer
+
+
+def test_append_drain():
+    buffer = LocalBuffer(10)
+    assert buffer.append(('one', 1, 1, None, 1))
+    assert not buffer.append(('two', 2, None, MaxAggregation, 1))
+    assert len(buffer) == 2
+    assert buffer.drain() == [('one', 1, 1, None, 1), ('two', 2, None, MaxAggregation, 1)]
+    assert not buffer
+    assert buffer.append(('three', 3, 3, None, 1))
+
+
+def test_overflow():
+    buffer = LocalBuffer(3)
+
+    for x in range(5):
+        buffer.append(('test_overflow', x, x, None, 1))
+
+    assert buffer.dropped == 2
+    assert [x[1] for x in buffer.drain()] == [2, 3, 4]
+
+
+def test_thread():
+    buffers = []
+    thread = Thread(target=lambda: buffers.append(LocalBuffer(1)))
+    thread.start()
+    thread.join()
+    assert buffers[0].thread is thread
+
+
+def test_invalid_size():
+    with raises(ValueError):
+        LocalBuffer(0)
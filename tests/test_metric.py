@@ -1,13 +1,16 @@
 from asyncio import sleep as asleep
 from time import sleep
-from typing import Optional
+from typing import Optional, Type
 
 from pytest import fail, mark, raises
 
-from asyncmetrics import (AvgMetric, AvgMsMetric, AvgNsMetric, AvgUsMetric, CountMetric, Graphite, MaxMetric,
-                          MaxMsMetric, MaxNsMetric, MaxUsMetric, Metric, MinMetric, MinMsMetric, MinNsMetric,
-                          MinUsMetric, MsMetric, NsMetric, SumMetric, SumMsMetric, SumNsMetric, SumUsMetric, UsMetric,
-                          count, time)
+from asyncmetrics import (AvgMetric, AvgMsMetric, AvgNsMetric, AvgUsMetric, CountMetric, Graphite, HistogramMetric,
+                          HistogramMsMetric, HistogramNsMetric, HistogramUsMetric, MaxMetric, MaxMsMetric, MaxNsMetric,
+                          MaxUsMetric, Metric, MinMetric, MinMsMetric, MinNsMetric, MinUsMetric, MsMetric, NsMetric,
+                          NullGraphite, SumMetric, SumMsMetric, SumNsMetric, SumUsMetric, TimerMetric, UsMetric, count,
+                          time)
+from asyncmetrics.aggregation import (Aggregation, CountAggregation, HistogramAggregation, MaxAggregation,
+                                      SumAggregation)
 
 
 class GraphiteMock(Graphite):
@@ -15,10 +18,16 @@ class GraphiteMock(Graphite):
     def __init__(self, name: str):
         self.name = name
         self.sent = []
+        self.aggregated = []
+        self.weights = []
 
     def send(self, metric: str, value: int, timestamp: Optional[int] = None):
         self.sent.append((metric, value, timestamp))
 
+    def aggregate(self, metric: str, value: int, aggregation: Type[Aggregation], weight: int = 1):
+        self.aggregated.append((metric, value, aggregation))
+        self.weights.append(weight)
+
 
 @mark.asyncio
 async def test_default_graphite():
@@ -135,7 +144,7 @@ def test_send():
     metric = Metric('test_send', graphite=graphite)
     metric.send(1)
     metric.send(2, 3)
-    assert graphite.sent == [('test_send', 1, None), ('test_send', 2, 3)]
+    assert graphite.sent == [(b'test_send', 1, None), (b'test_send', 2, 3)]
 
 
 def test_send_global_graphite():
@@ -143,7 +152,7 @@ def test_send_global_graphite():
     metric = Metric('test_send_global_graphite')
     metric.send(4)
     metric.send(5, 6)
-    assert Metric.graphite.sent == [('test_send_global_graphite', 4, None), ('test_send_global_graphite', 5, 6)]
+    assert Metric.graphite.sent == [(b'test_send_global_graphite', 4, None), (b'test_send_global_graphite', 5, 6)]
 
 
 def test_count():
@@ -158,7 +167,7 @@ def test_count():
     func()
     func()
 
-    assert graphite.sent == [('test_count', 1, None), ('test_count', 1, None), ('test_count', 1, None)]
+    assert graphite.sent == [(b'test_count', 1, None), (b'test_count', 1, None), (b'test_count', 1, None)]
 
 
 @mark.asyncio
@@ -175,9 +184,9 @@ async def test_count_async():
     await func()
 
     assert graphite.sent == [
-        ('test_count_async', 1, None),
-        ('test_count_async', 1, None),
-        ('test_count_async', 1, None),
+        (b'test_count_async', 1, None),
+        (b'test_count_async', 1, None),
+        (b'test_count_async', 1, None),
     ]
 
 
@@ -193,7 +202,7 @@ def test_time():
     func()
     func()
 
-    assert all(m == 'test_time' and 1 <= v // 1000000 <= 3 and t is None for m, v, t in graphite.sent)
+    assert all(m == b'test_time' and 1 <= v // 1000000 <= 3 and t is None for m, v, t in graphite.sent)
 
 
 @mark.asyncio
@@ -209,7 +218,166 @@ async def test_time_async():
     await func()
     await func()
 
-    assert all(m == 'test_time_async' and 1 <= v // 1000000 <= 3 and t is None for m, v, t in graphite.sent)
+    assert all(m == b'test_time_async' and 1 <= v // 1000000 <= 3 and t is None for m, v, t in graphite.sent)
+
+
+def test_timer():
+    graphite = GraphiteMock('test_timer')
+    metric = UsMetric('test_timer', graphite=graphite)
+
+    with metric.timer():
+        sleep(.001)
+
+    with raises(ZeroDivisionError):
+        with metric.timer():
+            1 / 0
+
+    assert [(m, t) for m, _, t in graphite.sent] == [(b'test_timer.time.us', None)]
+    assert 1 <= graphite.sent[0][1] // 1000 <= 3
+
+
+@mark.asyncio
+async def test_timer_async():
+    graphite = GraphiteMock('test_timer_async')
+    metric = MsMetric('test_timer_async', graphite=graphite)
+
+    async with metric.timer():
+        await asleep(.001)
+
+    assert [(m, t) for m, _, t in graphite.sent] == [(b'test_timer_async.time.ms', None)]
+    assert 1 <= graphite.sent[0][1] <= 3
+
+
+@mark.parametrize('klass,elapsed,value', [
+    (NsMetric, 1234567, 1234567),
+    (UsMetric, 1234567, 1235),
+    (MsMetric, 1234567, 1),
+    (MsMetric, 1500000, 2),
+    (Metric, 1, 1),
+])
+def test_calculate_time(klass, elapsed, value):
+    assert klass('test_calculate_time')._calculate_time(10, 10 + elapsed) == value
+
+
+@mark.parametrize('sample_rate,interval', [(1., 1), (.5, 2), (.1, 10), (.3, 3), (.0001, 10000)])
+def test_sample_rate(sample_rate, interval):
+    metric = Metric('test_sample_rate', sample_rate=sample_rate)
+    assert metric._interval == interval
+    assert metric.sample_rate == 1 / interval
+
+
+@mark.parametrize('sample_rate', [0, -1, 1.5])
+def test_invalid_sample_rate(sample_rate):
+    with raises(ValueError):
+        Metric('test_invalid_sample_rate', sample_rate=sample_rate)
+
+
+def test_sampled_count():
+    graphite = GraphiteMock('test_sampled_count')
+    aggregated = CountMetric('test_sampled_count', graphite=graphite, sample_rate=.1).count(lambda: None)
+    plain = Metric('test_sampled_count', graphite=graphite, sample_rate=.25).count(lambda: None)
+
+    for _ in range(100):
+        aggregated()
+        plain()
+
+    assert len(graphite.aggregated) == 10
+    assert set(graphite.weights) == {10}
+    assert len(graphite.sent) == 25
+    assert {v for _, v, _ in graphite.sent} == {4}
+
+
+@mark.asyncio
+async def test_sampled_time():
+    graphite = GraphiteMock('test_sampled_time')
+    metric = SumUsMetric('test_sampled_time', graphite=graphite, sample_rate=.5)
+
+    @metric.time
+    async def func():
+        pass
+
+    @metric.time
+    def sync_func():
+        pass
+
+    for _ in range(10):
+        await func()
+        sync_func()
+
+    with metric.timer():
+        pass
+
+    assert len(graphite.aggregated) in (10, 11)
+    assert set(graphite.weights) == {2}
+
+
+def test_bare_sampled_count():
+    Metric.graphite = GraphiteMock('test_bare_sampled_count')
+
+    @count('test_bare_sampled_count', sample_rate=.5)
+    def func():
+        pass
+
+    for _ in range(10):
+        func()
+
+    assert len(Metric.graphite.aggregated) == 5
+    assert set(Metric.graphite.weights) == {2}
+
+
+def test_disabled():
+    def func():
+        pass
+
+    async def coro():
+        pass
+
+    class DisabledMetric(Metric):
+        graphite = NullGraphite()
+
+    metric = DisabledMetric('test_disabled')
+    assert metric.disabled
+    assert metric.count(func) is func
+    assert metric.time(coro) is coro
+    assert not Metric('test_disabled', graphite=GraphiteMock('test_disabled')).disabled
+    assert Metric('test_disabled', graphite=NullGraphite()).count(func) is func
+
+    with metric.timer():
+        pass
+
+
+def test_disabled_bare():
+    Metric.graphite = NullGraphite()
+
+    def func():
+        pass
+
+    assert count(func) is func
+    assert time('test_disabled_bare', sample_rate=.5)(func) is func
+
+
+def test_tags():
+    graphite = GraphiteMock('test_tags')
+    CountMetric('test_tags', graphite=graphite, tags={'region': 'eu', 'dc': 'ams1'}).send(1)
+    Metric('test_tags', graphite=graphite, tags={'dc': 'ams1'}).send(1, 1)
+    assert graphite.aggregated == [(b'test_tags.count;dc=ams1;region=eu', 1, CountAggregation)]
+    assert graphite.sent == [(b'test_tags;dc=ams1', 1, 1)]
+
+
+def test_invalid_tags():
+    with raises(ValueError):
+        Metric('test_invalid_tags', tags={'dc': ''})
+
+
+def test_bare_count_tags():
+    Metric.graphite = GraphiteMock('test_bare_count_tags')
+
+    @count('test_bare_count_tags', tags={'dc': 'ams1'})
+    def func():
+        pass
+
+    func()
+    assert Metric.graphite.aggregated == [(b'test_bare_count_tags.count;dc=ams1', 1, CountAggregation)]
 
 
 def test_subclasses():
@@ -233,6 +401,11 @@ def test_subclasses():
     assert SumMsMetric('some').metric == 'some.sum.time.ms'
     assert SumUsMetric('some').metric == 'some.sum.time.us'
     assert SumNsMetric('some').metric == 'some.sum.time.ns'
+    assert HistogramMetric('some').metric == 'some'
+    assert HistogramMsMetric('some').metric == 'some.time.ms'
+    assert HistogramUsMetric('some').metric == 'some.time.us'
+    assert HistogramNsMetric('some').metric == 'some.time.ns'
+    assert TimerMetric('some').metric == 'some.time.us'
 
 
 def test_bare_count():
@@ -246,10 +419,10 @@ def test_bare_count():
     func()
     func()
 
-    assert Metric.graphite.sent == [
-        ('test_metric.test_bare_count.<locals>.func.count', 1, None),
-        ('test_metric.test_bare_count.<locals>.func.count', 1, None),
-        ('test_metric.test_bare_count.<locals>.func.count', 1, None),
+    assert Metric.graphite.aggregated == [
+        (b'test_metric.test_bare_count.<locals>.func.count', 1, CountAggregation),
+        (b'test_metric.test_bare_count.<locals>.func.count', 1, CountAggregation),
+        (b'test_metric.test_bare_count.<locals>.func.count', 1, CountAggregation),
     ]
 
 
@@ -264,10 +437,10 @@ def test_bare_count_named():
     func()
     func()
 
-    assert Metric.graphite.sent == [
-        ('test_bare_count_named.count', 1, None),
-        ('test_bare_count_named.count', 1, None),
-        ('test_bare_count_named.count', 1, None),
+    assert Metric.graphite.aggregated == [
+        (b'test_bare_count_named.count', 1, CountAggregation),
+        (b'test_bare_count_named.count', 1, CountAggregation),
+        (b'test_bare_count_named.count', 1, CountAggregation),
     ]
 
 
@@ -283,7 +456,7 @@ def test_bare_time():
     func()
 
     assert all(
-        m == 'test_metric.test_bare_time.<locals>.func.time.ns' and 1 <= v // 1000000 <= 3 and t is None
+        m == b'test_metric.test_bare_time.<locals>.func.time.ns' and 1 <= v // 1000000 <= 3 and t is None
         for m, v, t in Metric.graphite.sent
     )
 
@@ -300,7 +473,7 @@ def test_bare_time_named():
     func()
 
     assert all(
-        m == 'test_bare_time_named.time.ns' and 1 <= v // 1000000 <= 3 and t is None
+        m == b'test_bare_time_named.time.ns' and 1 <= v // 1000000 <= 3 and t is None
         for m, v, t in Metric.graphite.sent
     )
 
@@ -320,6 +493,48 @@ def test_time_classes():
     func()
 
     ns_data, us_data, ms_data = tuple(graphite.sent)
-    assert ms_data[0] == 'test_time_classes.time.ms' and 1 <= ms_data[1] <= 3
-    assert us_data[0] == 'test_time_classes.time.us' and 1 <= us_data[1] // 1000 <= 3
-    assert ns_data[0] == 'test_time_classes.time.ns' and 1 <= ns_data[1] // 1000000 <= 3
+    assert ms_data[0] == b'test_time_classes.time.ms' and 1 <= ms_data[1] <= 3
+    assert us_data[0] == b'test_time_classes.time.us' and 1 <= us_data[1] // 1000 <= 3
+    assert ns_data[0] == b'test_time_classes.time.ns' and 1 <= ns_data[1] // 1000000 <= 3
+
+
+def test_aggregated_send():
+    graphite = GraphiteMock('test_aggregated_send')
+    metric = MaxMsMetric('test_aggregated_send', graphite=graphite)
+    metric.send(1)
+    metric.send(2, 3)
+    assert graphite.aggregated == [(b'test_aggregated_send.max.time.ms', 1, MaxAggregation)]
+    assert graphite.sent == [(b'test_aggregated_send.max.time.ms', 2, 3)]
+
+
+def test_aggregation_classes():
+    assert Metric.aggregation is None
+    assert SumMetric.aggregation is SumAggregation
+    assert SumUsMetric.aggregation is SumAggregation
+    assert NsMetric.aggregation is None
+    assert HistogramMetric.aggregation is HistogramAggregation
+    assert TimerMetric.aggregation is HistogramAggregation
+
+
+def test_cached_name():
+    graphite = GraphiteMock('test_cached_name')
+    metric = Metric('test_cached_name', graphite=graphite)
+    metric.send(1)
+    Metric.prefix = 'prefixed'
+    metric.send(2)
+    del Metric.prefix
+    metric.send(3)
+    assert graphite.sent == [
+        (b'test_cached_name', 1, None),
+        (b'prefixed.test_cached_name', 2, None),
+        (b'test_cached_name', 3, None),
+    ]
+
+
+def test_cached_global_graphite():
+    Metric.graphite = GraphiteMock('test_cached_global_graphite')
+    metric = Metric('test_cached_global_graphite')
+    metric.send(1)
+    Metric.graphite = GraphiteMock('test_cached_global_graphite.other')
+    metric.send(2)
+    assert Metric.graphite.sent == [(b'test_cached_global_graphite', 2, None)]
@@ -1,11 +1,18 @@
-from asyncio import DatagramProtocol, StreamReader, get_event_loop, sleep, start_server
+from asyncio import DatagramProtocol, StreamReader, get_event_loop, sleep, start_server, start_unix_server
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from gzip import decompress
+from pickle import loads
 from random import randint
+from socket import IPPROTO_TCP, SOL_SOCKET, SO_KEEPALIVE, SO_SNDBUF, TCP_NODELAY
+from struct import unpack
 from typing import Tuple
 
 from pytest import mark, raises
 
-from asyncmetrics import GzipTcp, PlainTcp, PlainUdp, ProtocolError
+from asyncmetrics import (ConsistentHash, GzipTcp, GzipUnix, PartialUnix, PickleTcp, PickleTcpSsl, PlainTcp, PlainUdp,
+                          PlainUnix, ProtocolError)
+from asyncmetrics.aggregation import AvgAggregation, CountAggregation, HistogramAggregation
+from asyncmetrics.protocols.hashring import HashRing
 from asyncmetrics.protocols.protocol import Protocol
 
 
@@ -26,6 +33,16 @@ class TcpServer:
         await self._server.wait_closed()
 
 
+class TcpStreamServer(TcpServer):
+    async def _cb(self, r: StreamReader, _w):
+        self._sent.append(await r.read())
+
+
+class StalledServer(TcpServer):
+    async def _cb(self, _r, w):
+        self._sent.append(w)
+
+
 class SentDatagramProtocol(DatagramProtocol):
     def __init__(self, sent: list):
         self._sent = sent
@@ -108,6 +125,33 @@ async def test_send_tcp():
     assert sent == [b'test_send_tcp 1 1\n']
 
 
+@mark.asyncio
+async def test_send_unix(tmp_path):
+    sent = []
+    path = str(tmp_path / 'carbon.sock')
+
+    async def cb(r: StreamReader, _w):
+        sent.append(await r.read())
+
+    server = await start_unix_server(cb, path)
+
+    for protocol in PlainUnix(path), GzipUnix(path, gzip_min_size=0):
+        await protocol.send([('test_send_unix', 1, 1)])
+        protocol.close()
+
+    await sleep(.01)
+    server.close()
+    await server.wait_closed()
+    assert sent[0] == b'test_send_unix 1 1\n'
+    assert decompress(sent[1]) == b'test_send_unix 1 1\n'
+
+
+@mark.asyncio
+async def test_send_unix_failed(tmp_path):
+    with raises(ProtocolError):
+        await PlainUnix(str(tmp_path / 'missing.sock')).send([('test_send_unix_failed', 1, 1)])
+
+
 @mark.asyncio
 async def test_send_failed():
     async with TcpServer([]) as (host, port):
@@ -159,3 +203,392 @@ async def test_send_udp():
 ])
 def test_gzip(datatset, data):
     assert decompress(GzipTcp()._encode(datatset)) == data
+
+
+def test_plain_bytes():
+    assert PlainTcp()._encode([(b'one', 1, 1), ('two', 2, 2)]) == b'one 1 1\ntwo 2 2\n'
+
+
+def test_plain_chunks():
+    dataset = [('one', 1, 1), ('two', 2, 2), ('three', 3, 3)]
+    assert list(PlainTcp(max_batch_bytes=16)._iter_encode(dataset)) == [b'one 1 1\ntwo 2 2\n', b'three 3 3\n']
+    assert list(PlainTcp(max_batch_bytes=1)._iter_encode(dataset)) == [b'one 1 1\n', b'two 2 2\n', b'three 3 3\n']
+
+
+def test_gzip_chunks():
+    dataset = [('one', 1, 1), ('two', 2, 2), ('three', 3, 3)]
+    assert decompress(b''.join(GzipTcp(max_batch_bytes=16)._iter_encode(dataset))) == b'one 1 1\ntwo 2 2\nthree 3 3\n'
+
+
+def test_gzip_empty():
+    assert GzipTcp()._encode([]) == b''
+
+
+@mark.parametrize('gzip_level', [0, 1, 9])
+def test_gzip_level(gzip_level):
+    dataset = [('test_gzip_level', x, 1) for x in range(1000)]
+    data = PlainTcp()._encode(dataset)
+    encoded = GzipTcp(gzip_level=gzip_level)._encode(dataset)
+    assert decompress(encoded) == data
+    assert (len(encoded) > len(data)) is (gzip_level == 0)
+
+
+def test_gzip_min_size():
+    dataset = [('test_gzip_min_size', 1, 1)] * 10
+    data = PlainTcp()._encode(dataset)
+    encoded = GzipTcp(gzip_min_size=len(data) + 1)._encode(dataset)
+    assert decompress(encoded) == data
+    assert len(encoded) > len(data)
+    assert len(GzipTcp(gzip_min_size=len(data))._encode(dataset)) < len(data)
+
+
+@mark.asyncio
+async def test_send_udp_mtu():
+    sent = []
+
+    async with UdpServer(sent) as (host, port):
+        protocol = PlainUdp(host, port, mtu=32)
+        await protocol.send([('test_send_udp_mtu', x, 1) for x in range(3)])
+        await sleep(.001)
+        protocol.close()
+
+    assert sent == [b'test_send_udp_mtu %d 1\n' % x for x in range(3)]
+    assert protocol.datagrams == 3
+
+
+@mark.asyncio
+async def test_send_udp_packed():
+    sent = []
+
+    async with UdpServer(sent) as (host, port):
+        protocol = PlainUdp(host, port)
+        await protocol.send([('test_send_udp_packed', x, 1) for x in range(100)])
+        await sleep(.001)
+        protocol.close()
+
+    assert all(len(x) <= 1432 and x.endswith(b'\n') for x in sent)
+    assert b''.join(sent) == b''.join(b'test_send_udp_packed %d 1\n' % x for x in range(100))
+    assert protocol.datagrams == len(sent) == 2
+
+
+@mark.asyncio
+async def test_udp_datagrams_total():
+    async with UdpServer([]) as (host, port):
+        protocol = PlainUdp(host, port, mtu=32)
+
+        for x in range(3):
+            await protocol.send([('test_udp_datagrams_total', x, 1)] * 2)
+
+        protocol.close()
+
+    assert protocol.datagrams == 6
+
+
+@mark.asyncio
+@mark.parametrize('executor_class', [ThreadPoolExecutor, ProcessPoolExecutor])
+async def test_send_executor(executor_class):
+    sent = []
+    dataset = [('test_send_executor', x, 1) for x in range(100)]
+
+    with executor_class(1) as executor:
+        executor.submit(int).result()
+
+        async with TcpStreamServer(sent) as (host, port):
+            protocol = GzipTcp(host, port, executor=executor, executor_threshold=100)
+            await protocol.send(dataset)
+            protocol.close()
+            await sleep(.01)
+
+    assert decompress(sent[0]) == PlainTcp()._encode(dataset)
+    assert protocol.encode_time > 0
+
+
+@mark.asyncio
+async def test_encode_time():
+    async with TcpServer([]) as (host, port):
+        protocol = PlainTcp(host, port)
+        assert protocol.encode_time == 0
+        await protocol.send([('test_encode_time', 1, 1)])
+        protocol.close()
+
+    assert protocol.encode_time > 0
+
+
+def test_plain_long_line():
+    dataset = [('one', 1, 1), ('three' * 4, 3, 3), ('two', 2, 2)]
+    assert list(PlainTcp(max_batch_bytes=16)._iter_encode(dataset)) == [
+        b'one 1 1\n',
+        b'threethreethreethree 3 3\n',
+        b'two 2 2\n',
+    ]
+
+
+def test_plain_blocks():
+    dataset = [(b'test_plain_blocks', x, 1) for x in range(3000)]
+    data = b''.join(b'test_plain_blocks %d 1\n' % x for x in range(3000))
+    chunks = list(PlainTcp(max_batch_bytes=1000)._iter_encode(dataset))
+    assert b''.join(chunks) == data
+    assert all(len(x) <= 1000 and x.endswith(b'\n') for x in chunks)
+
+
+def unpickle_frames(data: bytes) -> list:
+    frames = []
+
+    while data:
+        size, = unpack('!L', data[:4])
+        frames.append(loads(data[4:4 + size]))
+        data = data[4 + size:]
+
+    return frames
+
+
+def test_pickle():
+    dataset = [('one', 1, 1), (b'two', 2, 2)]
+    assert unpickle_frames(PickleTcp()._encode(dataset)) == [[('one', (1, 1)), ('two', (2, 2))]]
+
+
+def test_pickle_max_frame_size():
+    dataset = [('test_pickle_max_frame_size', x, 1) for x in range(100)]
+    frames = list(PickleTcp(max_frame_size=512)._iter_encode(dataset))
+    assert len(frames) > 1
+    assert all(len(x) <= 512 for x in frames)
+    assert [x for frame in unpickle_frames(b''.join(frames)) for x in frame] == [
+        ('test_pickle_max_frame_size', (1, x)) for x in range(100)
+    ]
+
+
+def test_pickle_port():
+    assert PickleTcp()._port == 2004
+    assert PickleTcpSsl('localhost', 2014)._port == 2014
+
+
+@mark.asyncio
+async def test_send_pickle():
+    sent = []
+
+    async with TcpStreamServer(sent) as (host, port):
+        protocol = PickleTcp(host, port)
+        await protocol.send([('test_send_pickle', 1, 1)])
+        protocol.close()
+        await sleep(.01)
+
+    assert unpickle_frames(sent[0]) == [[('test_send_pickle', (1, 1))]]
+
+
+def test_partial():
+    histogram = HistogramAggregation(1)
+    histogram.add(1000)
+    dataset = [('one', 1, 1), (b'two', -2, 2)]
+    aggregations = [('three', CountAggregation(1, 3)), (b'four', AvgAggregation(5)), ('five', histogram)]
+    protocol = PartialUnix('/nonexistent')
+    data = protocol._encode(dataset) + b''.join(protocol._iter_frames(protocol._encode_aggregation(*x)
+                                                                      for x in aggregations))
+    decoded = []
+
+    while data:
+        size, = unpack('<L', data[:4])
+        decoded.extend(PartialUnix.decode(data[4:4 + size]))
+        data = data[4 + size:]
+
+    assert decoded[:2] == [(b'one', (1, 1)), (b'two', (-2, 2))]
+    assert [(m, type(a), a.state) for m, a in decoded[2:]] == [
+        (b'three', CountAggregation, (3,)),
+        (b'four', AvgAggregation, (5, 1)),
+        (b'five', HistogramAggregation, histogram.state),
+    ]
+
+
+def test_partial_unknown_kind():
+    with raises(ValueError):
+        list(PartialUnix.decode(b'\x7f\x01\x00a'))
+
+
+@mark.asyncio
+async def test_send_partial_failed(tmp_path):
+    protocol = PartialUnix(str(tmp_path / 'missing.sock'))
+
+    with raises(ProtocolError):
+        await protocol.send_aggregations([('test_send_partial_failed', CountAggregation(1))])
+
+
+def test_hashring():
+    nodes = [('127.0.0.1', 'a'), ('127.0.0.1', 'b'), ('127.0.0.1', 'c')]
+    ring = HashRing(nodes)
+    keys = ['test_hashring.{}'.format(x) for x in range(3000)]
+    owners = [ring.get(x) for x in keys]
+    assert all(300 < owners.count(x) for x in nodes)
+    assert sorted(ring.iter('test_hashring')) == nodes
+    assert [ring.get(x) for x in keys] == owners
+
+    ring.add(('127.0.0.1', 'd'))
+    assert all(ring.get(x) in (owner, ('127.0.0.1', 'd')) for x, owner in zip(keys, owners))
+
+    with raises(ValueError):
+        ring.add(('127.0.0.1', 'd'))
+
+    with raises(LookupError):
+        HashRing().get('test_hashring')
+
+
+def test_consistent_hash_invalid():
+    with raises(ValueError):
+        ConsistentHash([])
+
+    with raises(ValueError):
+        ConsistentHash([PlainTcp(), PlainTcp()])
+
+    with raises(ValueError):
+        ConsistentHash([PlainTcp(), PlainTcp()], instances=['a'])
+
+
+@mark.asyncio
+async def test_send_consistent_hash():
+    sent_a = []
+    sent_b = []
+    dataset = [('test_send_consistent_hash.{}'.format(x), x, 1) for x in range(100)]
+
+    async with TcpStreamServer(sent_a) as (host_a, port_a), TcpStreamServer(sent_b) as (host_b, port_b):
+        protocol = ConsistentHash([PlainTcp(host_a, port_a), PlainTcp(host_b, port_b)], instances=['a', 'b'])
+        await protocol.send(dataset)
+        protocol.close()
+        await sleep(.01)
+
+    ring = HashRing([(host_a, 'a'), (host_b, 'b')])
+    assert sent_a == [PlainTcp()._encode(x for x in dataset if ring.get(x[0]) == (host_a, 'a'))]
+    assert sent_b == [PlainTcp()._encode(x for x in dataset if ring.get(x[0]) == (host_b, 'b'))]
+
+
+@mark.asyncio
+async def test_send_consistent_hash_failover():
+    sent = []
+    dataset = [('test_send_consistent_hash_failover.{}'.format(x), x, 1) for x in range(100)]
+
+    async with TcpServer([]) as (dead_host, dead_port):
+        pass
+
+    async with TcpStreamServer(sent) as (host, port):
+        protocol = ConsistentHash([PlainTcp(host, port), PlainTcp(dead_host, dead_port)], instances=['a', 'b'])
+        await protocol.send(dataset)
+        protocol.close()
+        await sleep(.01)
+
+    assert sorted(b''.join(sent).splitlines()) == sorted(PlainTcp()._encode(dataset).splitlines())
+
+    with raises(ProtocolError):
+        await ConsistentHash([PlainTcp(dead_host, dead_port)]).send(dataset)
+
+
+@mark.asyncio
+async def test_send_consistent_hash_dead_node():
+    class CountingTcp(PlainTcp):
+        attempts = 0
+
+        async def _connect(self):
+            self.attempts += 1
+            return await super()._connect()
+
+    sent = []
+    dataset = [('test_send_consistent_hash_dead_node.{}'.format(x), x, 1) for x in range(100)]
+
+    async with TcpServer([]) as (dead_host, dead_port):
+        pass
+
+    async with TcpStreamServer(sent) as (host, port):
+        dead = CountingTcp(dead_host, dead_port)
+        protocol = ConsistentHash([PlainTcp(host, port), dead], instances=['a', 'b'], fail_wait_min=.05,
+                                  fail_wait=.05)
+
+        for _ in range(3):
+            await protocol.send(dataset)
+
+        assert dead.attempts == 1
+        await sleep(.06)
+        await protocol.send(dataset)
+        assert dead.attempts == 2
+        protocol.close()
+        await sleep(.01)
+
+    assert len(b''.join(sent).splitlines()) == 4 * len(dataset)
+
+    protocol = ConsistentHash([PlainTcp(dead_host, dead_port)], fail_wait_min=60, fail_wait=60)
+
+    with raises(ProtocolError):
+        await protocol.send(dataset)
+
+    with raises(ProtocolError, match='down'):
+        await protocol.send(dataset)
+
+
+@mark.asyncio
+async def test_bytes_written():
+    async with TcpServer([]) as (host, port):
+        protocol = PlainTcp(host, port)
+        await protocol.send([('test_bytes_written', 1, 1)])
+        protocol.close()
+
+    assert protocol.bytes_written == len(b'test_bytes_written 1 1\n')
+
+
+@mark.asyncio
+async def test_tcp_tune():
+    async with TcpServer([]) as (host, port):
+        protocol = PlainTcp(host, port, send_buffer_size=65536, write_buffer_size=4096)
+        await protocol.connect()
+        sock = protocol._writer.get_extra_info('socket')
+
+        assert sock.getsockopt(IPPROTO_TCP, TCP_NODELAY)
+        assert sock.getsockopt(SOL_SOCKET, SO_KEEPALIVE)
+        assert sock.getsockopt(SOL_SOCKET, SO_SNDBUF) >= 65536
+        assert protocol._writer.transport.get_write_buffer_limits()[1] == 4096
+
+        protocol.close()
+
+        protocol = PlainTcp(host, port, nodelay=False, keepalive=False)
+        await protocol.connect()
+        sock = protocol._writer.get_extra_info('socket')
+
+        assert not sock.getsockopt(IPPROTO_TCP, TCP_NODELAY)
+        assert not sock.getsockopt(SOL_SOCKET, SO_KEEPALIVE)
+
+        protocol.close()
+
+
+@mark.asyncio
+async def test_connect_timeout():
+    class SlowTcp(PlainTcp):
+        async def _connect(self):
+            await sleep(1)
+
+    protocol = SlowTcp(connect_timeout=.01)
+
+    with raises(ProtocolError, match='Connect timed out'):
+        await protocol.send([('test_connect_timeout', 1, 1)])
+
+    with raises(ProtocolError, match='Connect timed out'):
+        await protocol.connect()
+
+    assert protocol.timeouts == 2
+
+
+@mark.asyncio
+async def test_write_timeout():
+    class BulkTcp(PlainTcp):
+        def _iter_encode(self, dataset):
+            for _ in range(64):
+                yield b'x' * 1048576
+
+    writers = []
+
+    async with StalledServer(writers) as (host, port):
+        protocol = BulkTcp(host, port, send_buffer_size=4096, write_timeout=.1)
+
+        with raises(ProtocolError, match='Write timed out'):
+            await protocol.send([('test_write_timeout', 1, 1)])
+
+        assert protocol.timeouts == 1
+        assert protocol._writer is None
+
+        for writer in writers:
+            writer.close()
+
+    assert ConsistentHash([protocol, PlainTcp('localhost', 1)]).timeouts == 1
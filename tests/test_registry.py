@@ -0,0 +1,88 @@
+from pytest import mark, raises
+
+from asyncmetrics import Registry
+from asyncmetrics.aggregation import HistogramAggregation, MaxAggregation
+
+
+def test_counter():
+    registry = Registry()
+    counter = registry.counter('test_counter')
+    counter.inc()
+    counter.inc(2)
+    counter.value += 1
+    assert registry.counter('test_counter') is counter
+    assert registry.collect() == [(b'test_counter', 4)]
+    assert registry.collect() == [(b'test_counter', 0)]
+
+
+@mark.asyncio
+async def test_counter_count():
+    registry = Registry()
+    counter = registry.counter('test_counter_count')
+
+    @counter.count
+    def func():
+        return 1
+
+    @counter.count
+    async def coro():
+        return 2
+
+    assert func() == 1
+    assert await coro() == 2
+    assert counter.value == 2
+
+
+def test_gauge():
+    registry = Registry('app')
+    gauge = registry.gauge('test_gauge', tags={'dc': 'ams1'})
+    assert registry.collect() == []
+    gauge.set(5)
+    gauge.inc()
+    gauge.dec(3)
+    assert registry.collect() == [(b'app.test_gauge;dc=ams1', 3)]
+    assert registry.collect() == [(b'app.test_gauge;dc=ams1', 3)]
+
+
+def test_callback():
+    pool = [1, 2, 3]
+    registry = Registry()
+    registry.callback('test_callback.size', lambda: len(pool))
+    registry.callback('test_callback.none', lambda: None)
+    registry.callback('test_callback.error', lambda: 1 / 0)
+    assert registry.collect() == [(b'test_callback.size', 3)]
+
+
+def test_aggregate():
+    registry = Registry()
+    aggregate = registry.aggregate('test_aggregate', MaxAggregation)
+    assert registry.collect() == []
+    aggregate.add(3)
+    aggregate.add(7)
+    assert registry.collect() == [(b'test_aggregate', 7)]
+    assert registry.collect() == []
+    histogram = registry.aggregate('test_aggregate.latency', HistogramAggregation, tags={'dc': 'ams1'})
+    histogram.add(5)
+    assert [x for x in registry.collect() if x[0].endswith(b'count;dc=ams1')] == [
+        (b'test_aggregate.latency.count;dc=ams1', 1),
+    ]
+
+
+def test_remove():
+    registry = Registry()
+    registry.counter('test_remove')
+    registry.remove('test_remove')
+    registry.remove('test_remove')
+    assert not len(registry)
+
+
+def test_conflict():
+    registry = Registry()
+    registry.counter('test_conflict')
+
+    with raises(TypeError):
+        registry.gauge('test_conflict')
+
+    with raises(TypeError):
+        # noinspection PyTypeChecker
+        registry.counter(b'test_conflict')
@@ -0,0 +1,101 @@
+from argparse import ArgumentTypeError
+from asyncio import open_connection, open_unix_connection, sleep
+
+from pytest import mark, raises
+
+from asyncmetrics import Graphite
+from asyncmetrics.aggregation import SumAggregation
+from asyncmetrics.relay import Relay, aggregation_rule
+from conftest import ProtocolMock
+
+
+@mark.asyncio
+async def test_relay(tmp_path):
+    path = str(tmp_path / 'relay.sock')
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=.01)
+    relay = Relay(graphite, path=path, host='127.0.0.1', port=0, aggregations={'.count': SumAggregation})
+    await relay.start()
+    port = relay._servers[1].sockets[0].getsockname()[1]
+
+    for number in range(3):
+        _, writer = await open_unix_connection(path)
+        writer.write(b'test_relay.value ' + str(number).encode() + b' 100\ntest_relay.count 5 100\n')
+        writer.write(b'test_relay.float 2.0 100\ntest_relay.fraction 1.6 100\n\ninvalid line\ntest_relay.')
+        writer.write(b'tail 7 100')
+        writer.close()
+
+    _, writer = await open_connection('127.0.0.1', port)
+    writer.write(b'test_relay.tcp 1 100\n')
+    writer.close()
+    await sleep(.05)
+    await relay.close()
+    await graphite.close()
+    assert sorted((n, v, t) for n, v, t in protocol.sent if t == 100) == [
+        (b'test_relay.float', 2, 100),
+        (b'test_relay.float', 2, 100),
+        (b'test_relay.float', 2, 100),
+        (b'test_relay.tail', 7, 100),
+        (b'test_relay.tail', 7, 100),
+        (b'test_relay.tail', 7, 100),
+        (b'test_relay.tcp', 1, 100),
+        (b'test_relay.value', 0, 100),
+        (b'test_relay.value', 1, 100),
+        (b'test_relay.value', 2, 100),
+    ]
+    assert [v for n, v, _ in protocol.sent if n == b'test_relay.count'] == [15]
+    assert relay.received == 3 * 4 + 1
+    assert relay.invalid == 6
+    assert not (tmp_path / 'relay.sock').exists()
+
+
+@mark.asyncio
+async def test_relay_long_line(tmp_path):
+    path = str(tmp_path / 'relay.sock')
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=.01)
+    relay = Relay(graphite, path=path, max_line=16, read_size=8)
+    await relay.start()
+    _, writer = await open_unix_connection(path)
+    writer.write(b'test_relay_long_line.' * 4 + b' 1 1\ntest 1 1\n')
+    writer.close()
+    await sleep(.05)
+    await relay.close()
+    await graphite.close()
+    assert [n for n, _, _ in protocol.sent] == [b'test']
+    assert relay.invalid == 1
+
+
+@mark.asyncio
+async def test_relay_stats(tmp_path):
+    path = str(tmp_path / 'relay.sock')
+    protocol = ProtocolMock()
+    graphite = Graphite(protocol=protocol, flush_interval=60, stats_prefix='relay')
+    relay = Relay(graphite, path=path)
+    await relay.start()
+    _, writer = await open_unix_connection(path)
+    writer.write(b'test_relay_stats 1 100\ntest_relay_stats 1.5 100\ntest_relay_stats 2 100\n')
+    writer.close()
+    await sleep(.01)
+    await graphite._flush(0.)
+    await graphite._flush(0.)
+    await relay.close()
+    await graphite.close()
+    received = [v for n, v, _ in protocol.sent if n == b'relay.relay.received']
+    invalid = [v for n, v, _ in protocol.sent if n == b'relay.relay.invalid']
+    assert received[:2] == [2, 0]
+    assert invalid[:2] == [1, 0]
+
+
+def test_relay_no_address():
+    with raises(ValueError):
+        Relay(Graphite.__new__(Graphite))
+
+
+def test_aggregation_rule():
+    assert aggregation_rule('.count=sum') == ('.count', SumAggregation)
+    assert aggregation_rule('.a=b=sum') == ('.a=b', SumAggregation)
+
+    for rule in '.count=median', 'sum', '=sum':
+        with raises(ArgumentTypeError):
+            aggregation_rule(rule)
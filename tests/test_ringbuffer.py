@@ -0,0 +1,98 @@
+from pytest import raises
+
+from asyncmetrics.ringbuffer import RingBuffer
+
+
+def test_push_pop():
+    buffer = RingBuffer(10)
+    buffer.push('one', 1, 1)
+    buffer.push(b'two', 2, 2)
+    assert len(buffer) == 2
+    assert buffer.pop() == [('one', 1, 1), (b'two', 2, 2)]
+    assert not buffer
+
+
+def test_pop_limit():
+    buffer = RingBuffer(10)
+
+    for x in range(5):
+        buffer.push('test_pop_limit', x, x)
+
+    assert buffer.pop(2) == [('test_pop_limit', 0, 0), ('test_pop_limit', 1, 1)]
+    assert len(buffer) == 3
+
+
+def test_overflow():
+    buffer = RingBuffer(3)
+
+    for x in range(5):
+        buffer.push('test_overflow', x, x)
+
+    assert buffer.dropped == 2
+    assert buffer.pop() == [('test_overflow', 2, 2), ('test_overflow', 3, 3), ('test_overflow', 4, 4)]
+
+
+def test_keep_evicted():
+    buffer = RingBuffer(3, keep_evicted=True)
+
+    for x in range(5):
+        buffer.push('test_keep_evicted.{}'.format(x), x, x)
+
+    with raises(OverflowError):
+        buffer.push('test_keep_evicted', 2 ** 63, 0)
+
+    assert not buffer.dropped
+    assert buffer.evicted == [('test_keep_evicted.0', 0, 0), ('test_keep_evicted.1', 1, 1)]
+    assert buffer.pop() == [('test_keep_evicted.{}'.format(x), x, x) for x in range(2, 5)]
+
+
+def test_wrap():
+    buffer = RingBuffer(3)
+
+    for x in range(2):
+        buffer.push('test_wrap', x, x)
+
+    buffer.pop(1)
+
+    for x in range(2, 4):
+        buffer.push('test_wrap', x, x)
+
+    assert not buffer.dropped
+    assert buffer.pop() == [('test_wrap', 1, 1), ('test_wrap', 2, 2), ('test_wrap', 3, 3)]
+
+
+def test_intern_drained():
+    buffer = RingBuffer(10)
+
+    for x in range(100000):
+        buffer.push('test_intern_drained.{}'.format(x), x, x)
+        assert buffer.pop() == [('test_intern_drained.{}'.format(x), x, x)]
+
+    assert len(buffer._names) == len(buffer._ids) == 0
+
+
+def test_intern_wrapped():
+    buffer = RingBuffer(10)
+
+    for x in range(100000):
+        buffer.push('test_intern_wrapped.{}'.format(x % 1000), x, x)
+
+        if x % 3 == 0 and x < 90000:
+            buffer.pop(1)
+
+    assert len(buffer._names) <= 20
+    assert buffer.pop() == [('test_intern_wrapped.{}'.format(x % 1000), x, x) for x in range(99990, 100000)]
+
+
+def test_invalid_value():
+    buffer = RingBuffer(3)
+
+    with raises(OverflowError):
+        buffer.push('test_invalid_value', 2 ** 64, 1)
+
+    assert not buffer
+
+
+def test_invalid_size():
+    with raises(ValueError):
+        RingBuffer(0)
@@ -0,0 +1,111 @@
+from os import listdir
+
+from asyncmetrics import SpillStore
+
+
+def test_write_read(tmp_path):
+    spill = SpillStore(str(tmp_path))
+    assert not spill
+    spill.write([('one', 1, 3), (b'two', 2, 1), ('three', 3, 2)])
+    assert spill
+    assert spill.read(2) == [(b'two', 2, 1), (b'three', 3, 2)]
+    spill.commit()
+    assert spill.read(2) == [(b'one', 1, 3)]
+    assert spill
+    spill.commit()
+    assert not spill
+    assert not listdir(str(tmp_path))
+
+
+def test_restart(tmp_path):
+    spill = SpillStore(str(tmp_path))
+    spill.write([('test_restart', 1, 1)])
+    spill.close()
+    spill = SpillStore(str(tmp_path))
+    spill.write([('test_restart', 2, 2)])
+    assert spill.read(10) == [(b'test_restart', 1, 1)]
+    spill.commit()
+    assert spill.read(10) == [(b'test_restart', 2, 2)]
+    spill.commit()
+    assert not spill
+
+
+def test_segments(tmp_path):
+    spill = SpillStore(str(tmp_path), segment_size=1)
+
+    for x in range(3):
+        spill.write([('test_segments', x, x)])
+
+    assert len(listdir(str(tmp_path))) == 3
+    read = []
+
+    for _ in range(4):
+        read.append(spill.read(10))
+        spill.commit()
+
+    assert read == [
+        [(b'test_segments', 0, 0)],
+        [(b'test_segments', 1, 1)],
+        [(b'test_segments', 2, 2)],
+        [],
+    ]
+
+
+def test_evict(tmp_path):
+    spill = SpillStore(str(tmp_path), max_size=100, segment_size=1)
+
+    for x in range(10):
+        spill.write([('test_evict', x, x)])
+
+    assert spill.size <= 100
+    assert spill.read(10) == [(b'test_evict', 7, 7)]
+
+
+def test_truncated(tmp_path):
+    spill = SpillStore(str(tmp_path))
+    spill.write([('test_truncated', 1, 1), ('test_truncated', 2, 2)])
+    spill.close()
+    name = str(tmp_path / listdir(str(tmp_path))[0])
+
+    with open(name, 'r+b') as f:
+        f.truncate(40)
+
+    assert SpillStore(str(tmp_path)).read(10) == [(b'test_truncated', 1, 1)]
+
+
+def test_uncommitted(tmp_path):
+    spill = SpillStore(str(tmp_path))
+    spill.write([('test_uncommitted', x, x) for x in range(3)])
+    assert spill.read(2) == [(b'test_uncommitted', 0, 0), (b'test_uncommitted', 1, 1)]
+    assert spill.read(2) == [(b'test_uncommitted', 2, 2)]
+    assert spill.read(2) == []
+    assert len(listdir(str(tmp_path))) == 1
+    assert SpillStore(str(tmp_path)).read(10) == [(b'test_uncommitted', x, x) for x in range(3)]
+
+
+def test_rollback(tmp_path):
+    spill = SpillStore(str(tmp_path))
+    spill.write([('test_rollback', x, x) for x in range(3)])
+    assert spill.read(2) == [(b'test_rollback', 0, 0), (b'test_rollback', 1, 1)]
+    spill.rollback()
+    assert spill.read(10) == [(b'test_rollback', x, x) for x in range(3)]
+    spill.commit()
+    assert not spill
+    assert not listdir(str(tmp_path))
+
+
+def test_close_uncommitted(tmp_path):
+    spill = SpillStore(str(tmp_path))
+    spill.write([('test_close_uncommitted', x, x) for x in range(3)])
+    spill.read(1)
+    spill.commit()
+    spill.read(1)
+    spill.close()
+    assert SpillStore(str(tmp_path)).read(10) == [(b'test_close_uncommitted', x, x) for x in range(1, 3)]
+
+
+def test_invalid_name(tmp_path):
+    spill = SpillStore(str(tmp_path))
+    assert spill.write([('a' * 65536, 1, 1), ('test_invalid_name', 2, 2)]) == 1
+    assert spill.write([('a' * 65536, 1, 1)]) == 1
+    assert spill.read(10) == [(b'test_invalid_name', 2, 2)]
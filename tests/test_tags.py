@@ -0,0 +1,30 @@
+from pytest import mark, raises
+
+from asyncmetrics.tags import _cache, encode_tags
+
+
+def test_encode_tags():
+    assert encode_tags({'region': 'eu', 'dc': 'ams1'}) == b';dc=ams1;region=eu'
+    assert encode_tags({'dc': 'ams1', 'region': 'eu'}) == b';dc=ams1;region=eu'
+    assert encode_tags({'port': 80}) == b';port=80'
+
+
+def test_encode_tags_cached():
+    tags = {'test': 'test_encode_tags_cached'}
+    assert encode_tags(tags) is encode_tags(dict(tags))
+    assert tuple(tags.items()) in _cache
+
+
+@mark.parametrize('tags', [
+    {'': 'value'},
+    {'a;b': 'value'},
+    {'a=b': 'value'},
+    {'a!': 'value'},
+    {'name': ''},
+    {'name': 'a;b'},
+    {'name': '~value'},
+    {'name': 'ünicode'},
+])
+def test_invalid_tags(tags):
+    with raises(ValueError):
+        encode_tags(tags)